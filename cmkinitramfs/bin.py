@@ -16,7 +16,7 @@ import os.path
 import platform
 import stat
 import subprocess
-from typing import FrozenSet, Iterator, List, Optional, Tuple, Union
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple, Union
 
 from elftools.common.exceptions import ELFError
 from elftools.elf.elffile import ELFFile
@@ -103,7 +103,7 @@ def parse_ld_so_conf_iter(conf_path: Optional[str] = None, root: str = '/') \
                 yield normpath(root + line)
 
 
-@functools.lru_cache()
+@functools.lru_cache(maxsize=None)
 def parse_ld_so_conf_tuple(conf_path: Optional[str] = None, root: str = '/') \
         -> Tuple[str, ...]:
     """Parse a ldso config file
@@ -118,7 +118,7 @@ def parse_ld_so_conf_tuple(conf_path: Optional[str] = None, root: str = '/') \
     return tuple(parse_ld_so_conf_iter(conf_path, root))
 
 
-@functools.lru_cache()
+@functools.lru_cache(maxsize=None)
 def _get_default_libdirs(root: str = '/') -> Tuple[str, ...]:
     """Get the default library directories
 
@@ -134,7 +134,7 @@ def _get_default_libdirs(root: str = '/') -> Tuple[str, ...]:
     return tuple(libdirs)
 
 
-@functools.lru_cache()
+@functools.lru_cache(maxsize=None)
 def _get_libdir(arch: int, root: str = '/') -> str:
     """Get the libdir corresponding to a binary class
 
@@ -307,7 +307,7 @@ def find_elf_deps_iter(src: str, root: str = '/') -> Iterator[Tuple[str, str]]:
     logger.debug("Found all ELF dependencies for %s", src)
 
 
-@functools.lru_cache()
+@functools.lru_cache(maxsize=None)
 def find_elf_deps_set(src: str, root: str = '/') -> FrozenSet[Tuple[str, str]]:
     """Find dependencies of an ELF file
 
@@ -377,6 +377,7 @@ def find_lib(lib: str, compat: Optional[str] = None, root: str = '/') \
     """Search a library in the system, without globbing
 
     Uses ``ld.so.conf`` and ``LD_LIBRARY_PATH``.
+    The result is cached until :func:`clear_caches` is called.
 
     Libraries will be installed in the default library directory in the
     initramfs.
@@ -391,6 +392,12 @@ def find_lib(lib: str, compat: Optional[str] = None, root: str = '/') \
         path of the library on the initramfs
     :raises FileNotFoundError: Library not found
     """
+    return _find_lib(lib, compat, root)
+
+
+@functools.lru_cache(maxsize=None)
+def _find_lib(lib: str, compat: Optional[str], root: str) -> Tuple[str, str]:
+    """Search a library in the system, see :func:`find_lib` (cached)"""
     return next(find_lib_iter(glob.escape(lib), compat, root))
 
 
@@ -421,6 +428,7 @@ def find_exec(executable: str, compat: Optional[str] = None, root: str = '/') \
     """Search an executable in the system
 
     Uses the ``PATH`` environment variable.
+    The result is cached until :func:`clear_caches` is called.
 
     :param executable: Executable to search
     :param compat: Path to a binary that the executable must be compatible with
@@ -433,6 +441,13 @@ def find_exec(executable: str, compat: Optional[str] = None, root: str = '/') \
     :return: Absolute path of the executable
     :raises FileNotFoundError: Executable not found
     """
+    return _find_exec(executable, compat, root)
+
+
+@functools.lru_cache(maxsize=None)
+def _find_exec(executable: str, compat: Optional[str], root: str) \
+        -> Tuple[str, str]:
+    """Search an executable in the system, see :func:`find_exec` (cached)"""
     if compat is None:
         compat = normpath(root + '/bin/sh')
     logger.debug("Searching executable %s (compat: %s)", executable, compat)
@@ -466,7 +481,7 @@ def find_exec(executable: str, compat: Optional[str] = None, root: str = '/') \
     raise FileNotFoundError(executable)
 
 
-@functools.lru_cache()
+@functools.lru_cache(maxsize=None)
 def _get_all_kmods(kernel: str) -> FrozenSet[str]:
     """Get all kernel modules on the system
 
@@ -483,7 +498,24 @@ def _get_all_kmods(kernel: str) -> FrozenSet[str]:
         ))
 
 
-@functools.lru_cache()
+@functools.lru_cache(maxsize=None)
+def _get_kmods_by_name(kernel: str) -> Dict[str, str]:
+    """Index kernel modules on the system by name
+
+    Names are compared with ``-`` and ``_`` considered equal, as done
+    by the kernel: ``{name.replace('_', '-'): path}``.
+
+    :param kernel: Target kernel version
+    :return: Dictionary of the absolute path of the modules,
+        see :func:`_get_all_kmods`
+    """
+    kmods: Dict[str, str] = {}
+    for kmod in _get_all_kmods(kernel):
+        kmods.setdefault(kmod.rpartition('/')[2].replace('_', '-'), kmod)
+    return kmods
+
+
+@functools.lru_cache(maxsize=None)
 def find_kmod_deps(path: str) -> FrozenSet[str]:
     """Get kernel module dependencies
 
@@ -494,7 +526,8 @@ def find_kmod_deps(path: str) -> FrozenSet[str]:
 
     cmd = ('modinfo', '-0', '-F', 'depends', path)
     logger.debug("Subprocess: %s", cmd)
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+    proc = subprocess.run(cmd, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.PIPE, check=True)
     return frozenset(
         k.strip('\0') for k
         in proc.stdout.decode('UTF-8').split(',') if k.strip('\0')
@@ -504,11 +537,19 @@ def find_kmod_deps(path: str) -> FrozenSet[str]:
 def find_kmod(module: str, kernel: str) -> Optional[str]:
     """Search a kernel module on the system
 
+    The result is cached until :func:`clear_caches` is called.
+
     :param module: Name of the kernel module
     :param kernel: Target kernel version
     :return: Absolute path of the kernel module on the system
     :raises FileNotFoundError: Kernel module not found
     """
+    return _find_kmod(module, kernel)
+
+
+@functools.lru_cache(maxsize=None)
+def _find_kmod(module: str, kernel: str) -> Optional[str]:
+    """Search a kernel module on the system, see :func:`find_kmod` (cached)"""
 
     def none_if_builtin(module: str) -> Optional[str]:
         module = normpath(module)
@@ -521,10 +562,25 @@ def find_kmod(module: str, kernel: str) -> Optional[str]:
     if os.path.isabs(module):
         logger.debug("Module path is absolute: %s", module)
         return none_if_builtin(module)
-    module_compat = module.replace('_', '-') + '.ko'
-    for kmod in _get_all_kmods(kernel):
-        if module_compat == os.path.basename(kmod).replace('_', '-'):
-            kmod = normpath(kmod)
-            logger.debug("Found module %s: %s", module, kmod)
-            return none_if_builtin(kmod)
-    raise FileNotFoundError(f"Kernel module not found: {module}")
+    kmod = _get_kmods_by_name(kernel).get(module.replace('_', '-') + '.ko')
+    if kmod is None:
+        raise FileNotFoundError(f"Kernel module not found: {module}")
+    kmod = normpath(kmod)
+    logger.debug("Found module %s: %s", module, kmod)
+    return none_if_builtin(kmod)
+
+
+def clear_caches() -> None:
+    """Clear the cached results of the lookup functions of this module
+
+    Library, executable and kernel module lookups, ELF dependencies and
+    ``ld.so.conf`` parsing are cached without size limit, so results
+    prefetched in parallel are kept until they are used by a build.
+    The cache should be cleared when the system changes (e.g. ``PATH``,
+    ``LD_LIBRARY_PATH``, ``ld.so.conf``, installed packages).
+    :class:`Initramfs` clears it when created.
+    """
+    for func in (parse_ld_so_conf_tuple, _get_default_libdirs, _get_libdir,
+                 find_elf_deps_set, _find_lib, _find_exec, _get_all_kmods,
+                 _get_kmods_by_name, find_kmod_deps, _find_kmod):
+        func.cache_clear()
@@ -15,7 +15,9 @@ from __future__ import annotations
 import itertools
 import os.path
 from shlex import quote
-from typing import Iterable, Iterator, IO, List, Optional, Set, Tuple
+from typing import (
+    FrozenSet, Iterable, Iterator, IO, List, Optional, Set, Tuple
+)
 
 
 class Data:
@@ -54,9 +56,9 @@ class Data:
     :param _is_final: The :class:`Data` should not be unloaded
     :param _is_loaded: The :class:`Data` is currently loaded
     """
-    files: Set[Tuple[str, Optional[str]]]
-    execs: Set[Tuple[str, Optional[str]]]
-    libs: Set[Tuple[str, Optional[str]]]
+    files: FrozenSet[Tuple[str, Optional[str]]]
+    execs: FrozenSet[Tuple[str, Optional[str]]]
+    libs: FrozenSet[Tuple[str, Optional[str]]]
     busybox: Set[str]
     kmods: Set[Tuple[str, Tuple[str, ...]]]
     _need: List[Data]
@@ -82,9 +84,9 @@ class Data:
         """
 
     def __init__(self) -> None:
-        self.files = set()
-        self.execs = set()
-        self.libs = set()
+        self.files = frozenset()
+        self.execs = frozenset()
+        self.libs = frozenset()
         self.busybox = set()
         self.kmods = set()
         self._need = []
@@ -99,14 +101,23 @@ class Data:
             and self._need == other._need and self._lneed == other._lneed \
             and self._is_final == other._is_final
 
-    def iter_all_deps(self) -> Iterator[Data]:
+    def iter_all_deps(self, seen: Optional[Set[int]] = None) \
+            -> Iterator[Data]:
         """Recursivelly get dependencies
 
+        Shared dependencies are only walked once.
+
+        :param seen: :func:`id` of the data already visited,
+            updated in place, can be shared between calls
         :return: Iterator over all the dependencies
         """
+        if seen is None:
+            seen = set()
         for dep in itertools.chain(self._need, self._lneed):
-            yield dep
-            yield from dep.iter_all_deps()
+            if id(dep) not in seen:
+                seen.add(id(dep))
+                yield dep
+                yield from dep.iter_all_deps(seen)
 
     def is_final(self) -> bool:
         """Returns a :class:`bool` indicating if the :class:`Data` is final"""
@@ -385,8 +396,8 @@ class LuksData(Data):
                  key: Optional[Data] = None, header: Optional[Data] = None,
                  discard: bool = False):
         super().__init__()
-        self.execs.add(('cryptsetup', None))
-        self.libs.add(('libgcc_s.so.1', None))
+        self.execs |= {('cryptsetup', None)}
+        self.libs |= {('libgcc_s.so.1', None)}
         self.kmods.add(('dm-crypt', ()))
         self.source = source
         self.name = name
@@ -413,29 +424,52 @@ class LuksData(Data):
         key_file = f'--key-file {self.key.path()} ' if self.key else ''
         discard = '--allow-discards ' if self.discard else ''
         self._pre_load(out)
-        out.writelines((
+        out.write(''.join((
             f"info 'Unlocking LUKS device {self}'\n",
             "cryptsetup ", header, key_file, discard,
             f"open {self.source.path()} {quote(self.name)} || die ",
             quote(f'Failed to unlock LUKS device {self}'), '\n',
             "\n",
-        ))
+        )))
         self._post_load(out)
 
     def unload(self, out: IO[str]) -> None:
         self._pre_unload(out)
-        out.writelines((
+        out.write(''.join((
             f"info 'Closing LUKS device {self}'\n",
             f"cryptsetup close {quote(self.name)} || die ",
             quote(f'Failed to close LUKS device {self}'), '\n',
             "\n",
-        ))
+        )))
         self._post_unload(out)
 
     def path(self) -> str:
         return quote('/dev/mapper/' + self.name)
 
 
+#: LVM configuration written by :class:`LvmData` initialization
+_LVM_CONF = ''.join((
+    "debug 'Writing LVM configuration'\n",
+    "mkdir -p /etc/lvm && touch /etc/lvm/lvmlocal.conf || warn ",
+    "'Failed to create LVM configuration file'\n",
+    "{\n",
+    "\techo 'activation/monitoring = 0'\n",
+    "\techo 'activation/udev_rules = 0'\n",
+    "\techo 'activation/udev_sync = 0'\n",
+    "\techo 'devices/external_device_info_source = \"none\"'\n",
+    "\techo 'devices/md_component_detection = 0'\n",
+    "\techo 'devices/multipath_component_detection = 0'\n",
+    "\techo 'devices/obtain_device_list_from_udev = 0'\n",
+    "\techo 'global/locking_type = 4'\n",
+    "\techo 'global/use_lvmetad = 0'\n",
+    "\techo 'global/use_lvmlockd = 0'\n",
+    "\techo 'global/use_lvmpolld = 0'\n",
+    "} >>/etc/lvm/lvmlocal.conf || warn ",
+    "'Failed to write LVM configuration file'\n"
+    "\n",
+))
+
+
 class LvmData(Data):
     """LVM logical volume
 
@@ -455,26 +489,7 @@ class LvmData(Data):
         Note: if ``/etc/lvm/lvmlocal.conf`` exists, we append to it,
         which may cause duplicate configuration warnings from LVM.
         """
-        out.writelines((
-            "debug 'Writing LVM configuration'\n",
-            "mkdir -p /etc/lvm && touch /etc/lvm/lvmlocal.conf || warn ",
-            "'Failed to create LVM configuration file'\n",
-            "{\n",
-            "\techo 'activation/monitoring = 0'\n",
-            "\techo 'activation/udev_rules = 0'\n",
-            "\techo 'activation/udev_sync = 0'\n",
-            "\techo 'devices/external_device_info_source = \"none\"'\n",
-            "\techo 'devices/md_component_detection = 0'\n",
-            "\techo 'devices/multipath_component_detection = 0'\n",
-            "\techo 'devices/obtain_device_list_from_udev = 0'\n",
-            "\techo 'global/locking_type = 4'\n",
-            "\techo 'global/use_lvmetad = 0'\n",
-            "\techo 'global/use_lvmlockd = 0'\n",
-            "\techo 'global/use_lvmpolld = 0'\n",
-            "} >>/etc/lvm/lvmlocal.conf || warn ",
-            "'Failed to write LVM configuration file'\n"
-            "\n",
-        ))
+        out.write(_LVM_CONF)
 
     @classmethod
     def initialize(cls, out: IO[str]) -> None:
@@ -483,7 +498,7 @@ class LvmData(Data):
 
     def __init__(self, vg_name: str, lv_name: str):
         super().__init__()
-        self.execs.add(('lvm', None))
+        self.execs |= {('lvm', None)}
         self.vg_name = vg_name
         self.lv_name = lv_name
 
@@ -496,7 +511,7 @@ class LvmData(Data):
 
     def load(self, out: IO[str]) -> None:
         self._pre_load(out)
-        out.writelines((
+        out.write(''.join((
             f"info 'Enabling LVM logical volume {self}'\n",
             "lvm lvchange --sysinit -a ly ",
             f"{quote(f'{self.vg_name}/{self.lv_name}')} || die ",
@@ -504,12 +519,12 @@ class LvmData(Data):
             "lvm vgmknodes || err ",
             quote(f'Failed to create LVM nodes for {self}'), '\n',
             "\n",
-        ))
+        )))
         self._post_load(out)
 
     def unload(self, out: IO[str]) -> None:
         self._pre_unload(out)
-        out.writelines((
+        out.write(''.join((
             f"info 'Disabling LVM logical volume {self}'\n",
             "lvm lvchange --sysinit -a ln ",
             f"{quote(f'{self.vg_name}/{self.lv_name}')} || die ",
@@ -517,7 +532,7 @@ class LvmData(Data):
             "lvm vgmknodes || err ",
             quote(f'Failed to remove LVM nodes for {self}'), '\n',
             "\n",
-        ))
+        )))
         self._post_unload(out)
 
     def path(self) -> str:
@@ -526,6 +541,42 @@ class LvmData(Data):
                      + '-' + self.lv_name.replace('-', '--'))
 
 
+#: ``fsck`` return code bits: ``{code: (log function, message)}``
+_FSCK_ERR = {
+    1: ('notice', "Filesystem errors corrected"),
+    2: ('notice', "System should be rebooted"),
+    4: ('alert', "Filesystem errors left uncorrected"),
+    8: ('crit', "Operational error"),
+    16: ('crit', "Usage or syntax error"),
+    32: ('err', "Checking canceled by user request"),
+    128: ('crit', "Shared-library error"),
+}
+#: ``fsck`` return code bits meaning a fatal error
+_FSCK_CODE_ERR = 4 | 8 | 16 | 32 | 64 | 128
+#: ``fsck`` return code bit meaning a reboot is required
+_FSCK_CODE_REBOOT = 2
+
+#: Definition of the ``mount_fsck`` function, see :class:`MountData`
+_FUN_FSCK = ''.join((
+    'mount_fsck()\n',
+    '{\n',
+    '\tFSTAB_FILE=/dev/null "$@"\n',
+    '\tfsck_ret=$?\n'
+    '\t[ "${fsck_ret}" -eq 0 ] && return 0\n',
+    *(
+        f'\t[ "$((fsck_ret & {err_code}))" -eq {err_code} ] && '
+        f'{err_call} {quote(f"fsck: {err_str}")}\n'
+        for err_code, (err_call, err_str) in _FSCK_ERR.items()
+    ),
+    '\t[ "$((fsck_ret & ', str(_FSCK_CODE_ERR), '))" -ne 0 ] && return 1\n',
+    '\tif [ "$((fsck_ret & ', str(_FSCK_CODE_REBOOT), '))" -eq 2 ]; then ',
+    'notice \'Rebooting...\'; reboot -f; fi\n',
+    '\treturn 0\n',
+    '}\n',
+    '\n',
+))
+
+
 class MountData(Data):
     """Mount point
 
@@ -559,39 +610,7 @@ class MountData(Data):
 
         :param out: Stream to write into
         """
-        fsck_err = {
-            1: ('notice', "Filesystem errors corrected"),
-            2: ('notice', "System should be rebooted"),
-            4: ('alert', "Filesystem errors left uncorrected"),
-            8: ('crit', "Operational error"),
-            16: ('crit', "Usage or syntax error"),
-            32: ('err', "Checking canceled by user request"),
-            128: ('crit', "Shared-library error"),
-        }
-        code_err = 4 | 8 | 16 | 32 | 64 | 128
-        code_reboot = 2
-
-        out.writelines((
-            'mount_fsck()\n',
-            '{\n',
-            '\tFSTAB_FILE=/dev/null "$@"\n',
-            '\tfsck_ret=$?\n'
-            '\t[ "${fsck_ret}" -eq 0 ] && return 0\n',
-        ))
-        for err_code, err_data in fsck_err.items():
-            err_call, err_str = err_data
-            out.writelines((
-                f'\t[ "$((fsck_ret & {err_code}))" -eq {err_code} ] && ',
-                err_call, ' ', quote(f"fsck: {err_str}"), '\n',
-            ))
-        out.writelines((
-            '\t[ "$((fsck_ret & ', str(code_err), '))" -ne 0 ] && return 1\n',
-            '\tif [ "$((fsck_ret & ', str(code_reboot), '))" -eq 2 ]; then ',
-            'notice \'Rebooting...\'; reboot -f; fi\n',
-            '\treturn 0\n',
-            '}\n',
-            '\n',
-        ))
+        out.write(_FUN_FSCK)
 
     @staticmethod
     def mkdir(path: str, fatal: bool = False) -> Iterable[str]:
@@ -616,29 +635,25 @@ class MountData(Data):
         self.filesystem = filesystem
         self.options = options
         if self.filesystem in ('btrfs',):
-            self.execs.add(('btrfs', None))
-            self.execs.add(('fsck.btrfs', None))
+            self.execs |= {('btrfs', None), ('fsck.btrfs', None)}
             self.kmods.add(('btrfs', ()))
         elif self.filesystem in ('ext4',):
-            self.execs.add(('fsck.ext4', None))
-            self.execs.add(('e2fsck', None))
+            self.execs |= {('fsck.ext4', None), ('e2fsck', None)}
             self.kmods.add(('ext4', ()))
         elif self.filesystem in ('xfs',):
-            self.execs.add(('fsck.xfs', None))
-            self.execs.add(('xfs_repair', None))
+            self.execs |= {('fsck.xfs', None), ('xfs_repair', None)}
             self.kmods.add(('xfs', ()))
         elif self.filesystem in ('fat', 'vfat'):
-            self.execs.add(('fsck.fat', None))
-            self.execs.add(('fsck.vfat', None))
+            self.execs |= {('fsck.fat', None), ('fsck.vfat', None)}
             self.kmods.add(('vfat', ()))
         elif self.filesystem in ('exfat',):
-            self.execs.add(('fsck.exfat', None))
+            self.execs |= {('fsck.exfat', None)}
             self.kmods.add(('exfat', ()))
         elif self.filesystem in ('f2fs',):
-            self.execs.add(('fsck.f2fs', None))
+            self.execs |= {('fsck.f2fs', None)}
             self.kmods.add(('f2fs', ()))
         elif self.filesystem in ('zfs',):
-            self.execs.add(('fsck.zfs', None))
+            self.execs |= {('fsck.zfs', None)}
             self.kmods.add(('zfs', ()))
         self.add_dep(self.source)
 
@@ -663,7 +678,7 @@ class MountData(Data):
             if os.path.dirname(self.mountpoint) == '/mnt' else ()
 
         self._pre_load(out)
-        out.writelines((
+        out.write(''.join((
             f"info 'Mounting filesystem {self}'\n",
             *fsck,
             *mkdir,
@@ -671,17 +686,17 @@ class MountData(Data):
             f"{self.source.path()} {quote(self.mountpoint)} || die ",
             quote(f'Failed to mount filesystem {self}'), '\n',
             "\n",
-        ))
+        )))
         self._post_load(out)
 
     def unload(self, out: IO[str]) -> None:
         self._pre_unload(out)
-        out.writelines((
+        out.write(''.join((
             f"info 'Unmounting filesystem {self}'\n",
             f"umount {quote(self.mountpoint)} || die ",
             quote(f'Failed to unmount filesystem {self}'), '\n',
             "\n",
-        ))
+        )))
         self._post_unload(out)
 
     def path(self) -> str:
@@ -701,7 +716,7 @@ class MdData(Data):
 
     def __init__(self, sources: Iterable[Data], name: str):
         super().__init__()
-        self.execs.add(('mdadm', None))
+        self.execs |= {('mdadm', None)}
         self.sources = tuple(sources)
         self.name = name
         if not self.sources:
@@ -726,24 +741,24 @@ class MdData(Data):
                 sources.add(f"{source.path()} ")
 
         self._pre_load(out)
-        out.writelines((
+        out.write(''.join((
             f"info 'Assembling MD RAID {self}'\n",
             "MDADM_NO_UDEV=1 ",
             "mdadm --assemble ", *sources, f"{quote(self.name)} || die ",
             quote(f'Failed to assemble MD RAID {self}'), '\n',
             "\n",
-        ))
+        )))
         self._post_load(out)
 
     def unload(self, out: IO[str]) -> None:
         self._pre_unload(out)
-        out.writelines((
+        out.write(''.join((
             f"info 'Stopping MD RAID {self}'\n",
             "MDADM_NO_UDEV=1 ",
             f"mdadm --stop {quote(self.name)} || die ",
             quote(f'Failed to stop MD RAID {self}'), '\n',
             "\n",
-        ))
+        )))
         self._post_unload(out)
 
     def path(self) -> str:
@@ -778,12 +793,12 @@ class CloneData(Data):
 
     def load(self, out: IO[str]) -> None:
         self._pre_load(out)
-        out.writelines((
+        out.write(''.join((
             f"info 'Cloning {self}'\n",
             f"cp -aT {self.source.path()} {self.dest.path()} || die ",
             quote(f'Failed to clone {self}'), '\n',
             "\n",
-        ))
+        )))
         self._post_load(out)
 
     def path(self) -> str:
@@ -807,7 +822,7 @@ class ZFSPoolData(Data):
 
         if self.cache is not None:
             self.add_load_dep(self.cache)
-        self.execs.add(('zpool', None))
+        self.execs |= {('zpool', None)}
         self.kmods.add(('zfs', ()))
 
     def __str__(self) -> str:
@@ -820,22 +835,22 @@ class ZFSPoolData(Data):
     def load(self, out: IO[str]) -> None:
         self._pre_load(out)
         cache = f'-c {self.cache.path()} ' if self.cache is not None else ''
-        out.writelines((
+        out.write(''.join((
             'info ', quote(f'Importing {self}'), '\n',
             'zpool import -N ', cache, quote(self.pool), ' || die ',
             quote(f'Failed to import {self}'), '\n',
             '\n',
-        ))
+        )))
         self._post_load(out)
 
     def unload(self, out: IO[str]) -> None:
         self._pre_unload(out)
-        out.writelines((
+        out.write(''.join((
             'info ', quote(f'Importing {self}'), '\n',
             'zpool export ', quote(self.pool), ' || die',
             quote(f'Failed to export {self}'), '\n',
             '\n',
-        ))
+        )))
         self._post_unload(out)
 
     def path(self) -> str:
@@ -870,7 +885,7 @@ class ZFSCryptData(Data):
         if self.key is not None:
             self.add_load_dep(self.key)
 
-        self.execs.add(('zfs', None))
+        self.execs |= {('zfs', None)}
 
     def __str__(self) -> str:
         return f'ZFS encrypted dataset {self.dataset}'
@@ -883,28 +898,44 @@ class ZFSCryptData(Data):
     def load(self, out: IO[str]) -> None:
         self._pre_load(out)
         key = f'-L {self.key.path()} ' if self.key is not None else ''
-        out.writelines((
+        out.write(''.join((
             'info ', quote(f'Unlocking {self}'), '\n',
             f'zfs load-key -r {key}{quote(self.dataset)} 1>&2 || die ',
             quote(f'Failed to unlock {self}'), '\n',
             '\n',
-        ))
+        )))
         self._post_load(out)
 
     def unload(self, out: IO[str]) -> None:
         self._pre_unload(out)
-        out.writelines((
+        out.write(''.join((
             'info ', quote(f'Locking {self}'), '\n',
             f'zfs unload-key -r {quote(self.dataset)} || die ',
             quote(f'Failed to lock {self}'), '\n',
             '\n',
-        ))
+        )))
         self._post_unload(out)
 
     def path(self) -> str:
         return quote(self.dataset)
 
 
+#: Definition of the ``find_iface`` function, see :class:`Network`
+_FUN_FIND_IFACE = ''.join((
+    'find_iface()\n',
+    '{\n',
+    '\tfor k in /sys/class/net/*; do\n',
+    '\t\tif ! grep -q "${1}" "${k}/address" 1>/dev/null 2>&1; ',
+    'then continue; fi\n',
+    '\t\techo "$(basename -- "${k}")"\n',
+    '\t\treturn 0\n',
+    '\tdone\n',
+    '\treturn 1\n'
+    '}\n',
+    '\n',
+))
+
+
 class Network(Data):
     """Networking configuration
 
@@ -939,20 +970,7 @@ class Network(Data):
 
         Return value: 0 on success, 1 on failure.
         """
-
-        out.writelines((
-            'find_iface()\n',
-            '{\n',
-            '\tfor k in /sys/class/net/*; do\n',
-            '\t\tif ! grep -q "${1}" "${k}/address" 1>/dev/null 2>&1; ',
-            'then continue; fi\n',
-            '\t\techo "$(basename -- "${k}")"\n',
-            '\t\treturn 0\n',
-            '\tdone\n',
-            '\treturn 1\n'
-            '}\n',
-            '\n',
-        ))
+        out.write(_FUN_FIND_IFACE)
 
     @classmethod
     def initialize(cls, out: IO[str]) -> None:
@@ -991,49 +1009,51 @@ class Network(Data):
         mask = quote(self.mask if self.mask is not None else '')
         gateway = quote(self.gateway if self.gateway is not None else '')
         iface = '"${iface}"'
-        iface_full = quote(f'{self.device} (') + iface + quote(')')
+        iface_full = quote(f'{self.device} (') + iface + "')'"
 
-        static_ip = (
-            f'ip addr add {ip}/{mask} dev {iface} || die ',
-            quote(f'Failed to add {self.ip} to '), iface_full, '\n',
-        )
-        dhcp_ip = (
-            f'udhcpc -nqfS -s /etc/udhcpc.script -i {iface} || die ',
-            quote('DHCP failed on '), iface_full, '\n',
-        )
-        gw_route = (
+        if self.ip is not None:
+            ip_setup: Tuple[str, ...] = (
+                f'ip addr add {ip}/{mask} dev {iface} || die ',
+                quote(f'Failed to add {self.ip} to '), iface_full, '\n',
+            )
+        else:
+            ip_setup = (
+                f'udhcpc -nqfS -s /etc/udhcpc.script -i {iface} || die ',
+                "'DHCP failed on '", iface_full, '\n',
+            )
+        gw_route: Tuple[str, ...] = () if self.gateway is None else (
             f'ip route add default via {gateway} dev {iface} || die ',
             quote(f'Failed to set gateway {self.gateway} on '),
             iface_full, '\n',
         )
 
         self._pre_load(out)
-        out.writelines((
+        out.write(''.join((
             'info ', quote(f'Raising {self}'), '\n',
             f'iface="$(find_iface {device})" || die ',
             quote(f'Failed to find network interface {self.device}'), '\n',
             f'ip link set {iface} up || die ',
-            quote('Failed to raise network interface '), iface_full, '\n',
-            *(static_ip if self.ip is not None else dhcp_ip),
-            *(gw_route if self.gateway is not None else ()),
+            "'Failed to raise network interface '", iface_full, '\n',
+            *ip_setup,
+            *gw_route,
             '\n',
-        ))
+        )))
         self._post_load(out)
 
     def unload(self, out: IO[str]) -> None:
         device = quote(self.device)
         iface = '"${iface}"'
-        iface_full = quote(f'{self.device} (') + iface + quote(')')
+        iface_full = quote(f'{self.device} (') + iface + "')'"
 
         self._pre_unload(out)
-        out.writelines((
+        out.write(''.join((
             'info ', quote(f'Shutting down {self}'), '\n',
             f'iface="$(find_iface {device})" || die ',
             quote(f'Failed to find network interface {self.device}'), '\n',
             f'ip link set {iface} down || die ',
-            quote('Failed to shutdown network interface '), iface_full, '\n',
+            "'Failed to shutdown network interface '", iface_full, '\n',
             '\n',
-        ))
+        )))
         self._post_unload(out)
 
 
@@ -1125,7 +1145,7 @@ class ISCSI(Data):
         )
 
         self._pre_load(out)
-        out.writelines((
+        out.write(''.join((
             'info ', quote(f'Loading {self}'), '\n',
             'iscsistart',
             ' -i ', quote(self.initiator),
@@ -1137,7 +1157,7 @@ class ISCSI(Data):
             *(auth_in if self.username_in is not None else ()),
             ' || die ', quote(f'Failed to load {self}'), '\n',
             '\n',
-        ))
+        )))
         self._post_load(out)
 
     def unload(self, out: IO[str]) -> None:
@@ -4,32 +4,44 @@ from __future__ import annotations
 
 import argparse
 import configparser
+import contextlib
+import functools
 import itertools
-import locale
 import logging
 import os
 import os.path
 import shlex
 import shutil
 import sys
+import tempfile
+import threading
 from collections import defaultdict
 from dataclasses import dataclass
 from typing import (
-    DefaultDict, Dict, Iterable, List, Mapping, Optional, Tuple, overload
+    IO, Callable, DefaultDict, Dict, Iterable, Iterator, List, Mapping,
+    Optional, Set, Tuple, overload,
 )
 
 import cmkinitramfs
 import cmkinitramfs.data as datamod
 import cmkinitramfs.initramfs as mkramfs
-from .bin import find_lib, find_lib_iter
-from .init import (mkinit, Breakpoint, BUSYBOX_COMMON_DEPS,
+from .bin import find_exec, find_lib, find_lib_iter
+from .init import (mkinit, mkinit_to_path, Breakpoint, BUSYBOX_COMMON_DEPS,
                    BUSYBOX_KEYMAP_DEPS, BUSYBOX_KMOD_DEPS)
-from .utils import removeprefix
+from .utils import is_utf8_locale, load_hash_cache, save_hash_cache
 
 logger = logging.getLogger(__name__)
 _VERSION_INFO = \
     f"%(prog)s ({cmkinitramfs.__name__}) {cmkinitramfs.__version__}"
 BINARY_KEYMAP_MAGIC = b'bkeymap'
+#: Data string prefixes (``PREFIX=value``) and their :class:`Data` factory
+_DATA_PREFIXES: Dict[str, Callable[[str], datamod.Data]] = {
+    'PATH': datamod.PathData,
+    'UUID': functools.partial(datamod.UuidData, partition=False),
+    'LABEL': functools.partial(datamod.LabelData, partition=False),
+    'PARTUUID': functools.partial(datamod.UuidData, partition=True),
+    'PARTLABEL': functools.partial(datamod.LabelData, partition=True),
+}
 
 
 def _find_config_file() -> str:
@@ -102,29 +114,15 @@ def read_config(config_file: Optional[str] = None) -> Config:
         """Find a Data object from a data string"""
         if data_str is None:
             return None
-        if data_str.startswith('PATH='):
-            data_str = removeprefix(data_str, 'PATH=')
-            if data_dic.get(data_str) is None:
-                data_dic[data_str] = datamod.PathData(data_str)
-        elif data_str.startswith('UUID='):
-            data_str = removeprefix(data_str, 'UUID=')
-            if data_dic.get(data_str) is None:
-                data_dic[data_str] = datamod.UuidData(data_str, False)
-        elif data_str.startswith('LABEL='):
-            data_str = removeprefix(data_str, 'LABEL=')
-            if data_dic.get(data_str) is None:
-                data_dic[data_str] = datamod.LabelData(data_str, False)
-        elif data_str.startswith('PARTUUID='):
-            data_str = removeprefix(data_str, 'PARTUUID=')
-            if data_dic.get(data_str) is None:
-                data_dic[data_str] = datamod.UuidData(data_str, True)
-        elif data_str.startswith('PARTLABEL='):
-            data_str = removeprefix(data_str, 'PARTLABEL=')
-            if data_dic.get(data_str) is None:
-                data_dic[data_str] = datamod.LabelData(data_str, True)
-        elif data_str.startswith('DATA='):
-            data_str = removeprefix(data_str, 'DATA=')
-        elif data_dic.get(data_str) is None and os.path.isabs(data_str):
+        prefix, sep, value = data_str.partition('=')
+        if sep and prefix == 'DATA':
+            return data_dic[value]
+        data_type = _DATA_PREFIXES.get(prefix) if sep else None
+        if data_type is not None:
+            if value not in data_dic:
+                data_dic[value] = data_type(value)
+            return data_dic[value]
+        if data_str not in data_dic and os.path.isabs(data_str):
             data_dic[data_str] = datamod.PathData(data_str)
         return data_dic[data_str]
 
@@ -222,35 +220,35 @@ def read_config(config_file: Optional[str] = None) -> Config:
 
     # Define needed files, execs and libs
 
-    files = set()
+    files: Set[Tuple[str, Optional[str]]] = set()
     for data in itertools.chain((root,), mounts):
         files |= data.files
         for ddep in data.iter_all_deps():
             files |= ddep.files
-    for line in config['DEFAULT'].get('files', '').split('\n'):
+    for line in config['DEFAULT'].get('files', '').splitlines():
         if line:
-            src, *dest = line.split(':', maxsplit=1)
-            files.add((src, dest[0] if dest else None))
+            src, sep, dest = line.partition(':')
+            files.add((src, dest if sep else None))
 
-    execs = set()
+    execs: Set[Tuple[str, Optional[str]]] = set()
     for data in itertools.chain((root,), mounts):
         execs |= data.execs
         for ddep in data.iter_all_deps():
             execs |= ddep.execs
-    for line in config['DEFAULT'].get('execs', '').split('\n'):
+    for line in config['DEFAULT'].get('execs', '').splitlines():
         if line:
-            src, *dest = line.split(':', maxsplit=1)
-            execs.add((src, dest[0] if dest else None))
+            src, sep, dest = line.partition(':')
+            execs.add((src, dest if sep else None))
 
-    libs = set()
+    libs: Set[Tuple[str, Optional[str]]] = set()
     for data in itertools.chain((root,), mounts):
         libs |= data.libs
         for ddep in data.iter_all_deps():
             libs |= ddep.libs
-    for line in config['DEFAULT'].get('libs', '').split('\n'):
+    for line in config['DEFAULT'].get('libs', '').splitlines():
         if line:
-            src, *dest = line.split(':', maxsplit=1)
-            libs.add((src, dest[0] if dest else None))
+            src, sep, dest = line.partition(':')
+            libs.add((src, dest if sep else None))
 
     busybox = set()
     for data in itertools.chain((root,), mounts):
@@ -301,9 +299,9 @@ def read_config(config_file: Optional[str] = None) -> Config:
             config['DEFAULT'].get('keymap-path', '/tmp/keymap.bmap'),
             config['DEFAULT'].get('keymap-dest', '/root/keymap.bmap'),
         ) if config['DEFAULT'].getboolean('keymap', fallback=False) else None,
-        files=files,
-        execs=execs,
-        libs=libs,
+        files=frozenset(files),
+        execs=frozenset(execs),
+        libs=frozenset(libs),
         busybox=busybox,
         init_path=config['DEFAULT'].get('init-path', '/tmp/init.sh'),
         cmkcpiodir_opts=config['DEFAULT'].get(
@@ -317,19 +315,84 @@ def read_config(config_file: Optional[str] = None) -> Config:
         scripts=scripts,
     )
 
-    # Configure final data sources
+    # Configure final data sources (Data objects are not hashable: use id)
+    final_ids: Set[int] = set()
     for data in itertools.chain(ret_cfg.mounts, (ret_cfg.root,)):
+        if id(data) in final_ids:
+            continue
+        final_ids.add(id(data))
         data.set_final()
 
     return ret_cfg
 
 
+def _remove_tree(path: str) -> Optional[threading.Thread]:
+    """Remove a directory tree in the background
+
+    The directory is atomically moved into a new trash directory next to
+    it, then removed by a thread, so the caller does not wait for the
+    removal. The thread is not a daemon: the interpreter waits for it
+    before exiting. Removal errors are logged.
+
+    :param path: Directory to remove
+    :return: Thread removing the directory, already started,
+        or :data:`None` if the directory cannot be moved (e.g. mount point)
+        and has been removed in place
+    :raises FileNotFoundError: ``path`` does not exist
+    """
+    parent, name = os.path.split(os.path.normpath(path))
+    trash = tempfile.mkdtemp(prefix=f'.{name}.', suffix='.deleting',
+                             dir=parent or os.curdir)
+    try:
+        os.rename(os.path.join(parent, name), os.path.join(trash, name))
+    except OSError:
+        os.rmdir(trash)
+        shutil.rmtree(os.path.join(parent, name))
+        return None
+
+    def remove() -> None:
+        logger.debug("Removing %s", trash)
+        try:
+            shutil.rmtree(trash)
+        except OSError as err:
+            logger.error("Cannot remove %s: %s", trash, err)
+
+    thread = threading.Thread(target=remove, name=f'remove {path}')
+    thread.start()
+    return thread
+
+
+def _cleanup(path: str, directory: bool = False) -> None:
+    """Remove a temporary file, does nothing if it does not exist
+
+    :param path: Path of the file to remove
+    :param directory: ``path`` is a directory, remove it recursively
+        (see :func:`_remove_tree`)
+    """
+    try:
+        if directory:
+            thread = _remove_tree(path)
+            if thread is not None:
+                thread.join()
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        return
+    logger.info("Cleaned %s", path)
+
+
+@functools.lru_cache()
+def _cmkinit_parser() -> argparse.ArgumentParser:
+    """Create the parser for cmkinit"""
+    parser = argparse.ArgumentParser(description="Build an init script")
+    parser.add_argument('--version', action='version', version=_VERSION_INFO)
+    return parser
+
+
 def entry_cmkinit() -> None:
     """Main entry point of the module"""
     config = read_config()
-    parser = argparse.ArgumentParser(description="Build an init script")
-    parser.add_argument('--version', action='version', version=_VERSION_INFO)
-    parser.parse_args()
+    _cmkinit_parser().parse_args()
     mkinit(
         out=sys.stdout,
         root=config.root,
@@ -340,6 +403,7 @@ def entry_cmkinit() -> None:
     )
 
 
+@functools.lru_cache()
 def _common_parser_logging(verbose: bool = False, quiet: int = 0) \
         -> argparse.ArgumentParser:
     """Create the common parser for entry points with a logger
@@ -374,9 +438,9 @@ def _set_logging_level(verbose: bool, quiet: int) -> None:
     logging.getLogger().setLevel(level)
 
 
-def entry_findlib() -> None:
-    """Entry point for the findlib utility"""
-
+@functools.lru_cache()
+def _findlib_parser() -> argparse.ArgumentParser:
+    """Create the parser for findlib"""
     parser = argparse.ArgumentParser(
         description="Find a library on the system",
         parents=(_common_parser_logging(),),
@@ -402,7 +466,13 @@ def entry_findlib() -> None:
         'libs', metavar='LIB', type=str, nargs='+',
         help="library to search",
     )
-    args = parser.parse_args()
+    return parser
+
+
+def entry_findlib() -> None:
+    """Entry point for the findlib utility"""
+
+    args = _findlib_parser().parse_args()
     _set_logging_level(args.verbose, args.quiet + 1)
 
     errors = False
@@ -424,6 +494,7 @@ def entry_findlib() -> None:
     sys.exit(0 if not errors else 1)
 
 
+@functools.lru_cache()
 def _common_parser_cmkcpio() -> argparse.ArgumentParser:
     """Create the common parser for cmkcpio* entry points"""
     parser = argparse.ArgumentParser(
@@ -454,21 +525,81 @@ def _common_parser_cmkcpio() -> argparse.ArgumentParser:
         '--no-kmod', action='store_true', default=False,
         help="disable kernel modules support",
     )
+    parser.add_argument(
+        '--zstd', '-z', type=int, nargs='?', const=19, default=None,
+        choices=range(1, 20), metavar='LEVEL',
+        help="compress the CPIO archive with zstd, at LEVEL from 1 to 19 "
+        "(default: 19)",
+    )
+    parser.add_argument(
+        '--hash-cache', type=str, default=None, metavar='FILE',
+        help="keep the hashes of the initramfs files in FILE between runs",
+    )
     return parser
 
 
-def _build_initramfs(initramfs: mkramfs.Initramfs, config: Config) -> None:
-    """Add files to the initramfs from the configuration"""
+@contextlib.contextmanager
+def _open_archive(output: str, zstd: Optional[int]) -> Iterator[IO[bytes]]:
+    """Open the CPIO archive output (``-`` for stdout), compressed or not
+
+    :param zstd: ``zstd`` compression level, :data:`None` to not compress
+    """
+    with contextlib.ExitStack() as stack:
+        dest = sys.stdout.buffer if output == '-' \
+            else stack.enter_context(open(output, 'wb'))
+        if zstd is not None:
+            dest = stack.enter_context(mkramfs.compress_zstd(dest, zstd))
+        yield dest
+
+
+def _sorted_files(files: Iterable[Tuple[str, Optional[str]]]) \
+        -> List[Tuple[str, Optional[str]]]:
+    """Sort ``(source, destination)`` pairs, for a reproducible initramfs"""
+    return sorted(files, key=lambda file: (file[0], file[1] or ''))
+
+
+def _prefetch_initramfs(initramfs: mkramfs.Initramfs, config: Config) \
+        -> None:
+    """Read the files needed by the configuration in parallel
+
+    See :meth:`cmkinitramfs.initramfs.Initramfs.prefetch` and
+    :meth:`cmkinitramfs.initramfs.Initramfs.prefetch_kmods`.
+    """
+    srcs = [src for src, _ in config.files]
+    execs = [*(name for name, _ in config.execs), 'busybox']
+    for find, names in ((find_lib, [name for name, _ in config.libs]),
+                        (find_exec, execs)):
+        for name in names:
+            try:
+                srcs.append(find(name, root=initramfs.binroot)[0])
+            except FileNotFoundError:
+                # Raised again when adding the file
+                pass
+    initramfs.prefetch(srcs)
+    if initramfs.kernels:
+        initramfs.prefetch_kmods(config.modules)
+
+
+def _build_initramfs(initramfs: mkramfs.Initramfs, config: Config,
+                     hash_cache: Optional[str] = None) -> None:
+    """Add files to the initramfs from the configuration
+
+    :param hash_cache: File keeping the file hashes between runs,
+        see :func:`cmkinitramfs.utils.load_hash_cache`
+    """
     busybox_deps = set(config.busybox) | BUSYBOX_COMMON_DEPS
+    if hash_cache is not None:
+        load_hash_cache(hash_cache)
+    _prefetch_initramfs(initramfs, config)
 
-    # Add necessary files
-    for src, dest in config.files:
+    # Add necessary files, sets are sorted to keep the output reproducible
+    for src, dest in _sorted_files(config.files):
         logger.info("Adding file %s", src)
         initramfs.add_file(src, dest)
-    for src, dest in config.libs:
+    for src, dest in _sorted_files(config.libs):
         logger.info("Adding library %s", src)
         initramfs.add_library(src, dest)
-    for src, dest in config.execs:
+    for src, dest in _sorted_files(config.execs):
         logger.info("Adding executable %s", src)
         initramfs.add_executable(src, dest)
 
@@ -497,14 +628,16 @@ def _build_initramfs(initramfs: mkramfs.Initramfs, config: Config) -> None:
     logger.info("Adding busybox")
     initramfs.add_busybox(needed=busybox_deps)
 
+    if hash_cache is not None:
+        try:
+            save_hash_cache(hash_cache)
+        except OSError as err:
+            logger.warning("Cannot save hash cache: %s", err)
 
-def entry_cmkcpiolist() -> None:
-    """Entry point for cmkcpiolist"""
-
-    # Load configuration
-    config = read_config()
 
-    # Arguments
+@functools.lru_cache()
+def _cmkcpiolist_parser() -> argparse.ArgumentParser:
+    """Create the parser for cmkcpiolist"""
     parser = argparse.ArgumentParser(
         description="Build an initramfs using a CPIO list",
         parents=(_common_parser_cmkcpio(),)
@@ -526,9 +659,19 @@ def entry_cmkcpiolist() -> None:
         '--cpio-list', '-l', type=str, default='/tmp/initramfs.list',
         help="set the location of the CPIO list"
     )
-    args = parser.parse_args(
-        shlex.split(config.cmkcpiolist_opts, posix=True) + sys.argv[1:]
-    )
+    return parser
+
+
+def entry_cmkcpiolist() -> None:
+    """Entry point for cmkcpiolist"""
+
+    # Load configuration
+    config = read_config()
+
+    # Arguments
+    default_opts = shlex.split(config.cmkcpiolist_opts, posix=True) \
+        if config.cmkcpiolist_opts.strip() else []
+    args = _cmkcpiolist_parser().parse_args(default_opts + sys.argv[1:])
 
     _set_logging_level(args.verbose, args.quiet)
 
@@ -544,19 +687,18 @@ def entry_cmkcpiolist() -> None:
         with open(config.keymap[1], 'wb') as keymap_bin:
             mkramfs.keymap_build(
                 config.keymap[0], keymap_bin,
-                unicode=(locale.getdefaultlocale()[1] == 'UTF-8')
+                unicode=is_utf8_locale(),
             )
 
     # Init
-    with open(config.init_path, 'w') as init_file:
-        mkinit(
-            out=init_file,
-            root=config.root,
-            mounts=config.mounts,
-            keymap=(None if config.keymap is None else config.keymap[2]),
-            modules=(None if args.no_kmod else config.modules),
-            scripts=config.scripts,
-        )
+    mkinit_to_path(
+        path=config.init_path,
+        root=config.root,
+        mounts=config.mounts,
+        keymap=(None if config.keymap is None else config.keymap[2]),
+        modules=(None if args.no_kmod else config.modules),
+        scripts=config.scripts,
+    )
 
     # Initramfs
     if not args.only_build_archive:
@@ -568,7 +710,7 @@ def entry_cmkcpiolist() -> None:
             binroot=args.binroot,
             kernels=(() if args.no_kmod else args.kernel),
         )
-        _build_initramfs(initramfs, config)
+        _build_initramfs(initramfs, config, args.hash_cache)
 
         # CPIO list
         logger.info("Generating CPIO list")
@@ -581,32 +723,20 @@ def entry_cmkcpiolist() -> None:
     if not args.only_build_list:
         # Build CPIO archive
         logger.info("Generating CPIO archive to %s", args.output)
-        if args.output == '-':
-            mkramfs.mkcpio_from_list(args.cpio_list, sys.stdout.buffer)
-        else:
-            with open(args.output, 'wb') as cpiodest:
-                mkramfs.mkcpio_from_list(args.cpio_list, cpiodest)
+        with _open_archive(args.output, args.zstd) as cpiodest:
+            mkramfs.mkcpio_from_list(args.cpio_list, cpiodest)
 
     if not args.keep:
         # Cleanup temporary files
-        if os.path.exists(args.cpio_list):
-            logger.info("Cleaning %s", args.cpio_list)
-            os.remove(args.cpio_list)
-        if config.keymap is not None and os.path.exists(config.keymap[1]):
-            logger.info("Cleaning %s", config.keymap[1])
-            os.remove(config.keymap[1])
-        if os.path.exists(config.init_path):
-            logger.info("Cleaning %s", config.init_path)
-            os.remove(config.init_path)
-
+        _cleanup(args.cpio_list)
+        if config.keymap is not None:
+            _cleanup(config.keymap[1])
+        _cleanup(config.init_path)
 
-def entry_cmkcpiodir() -> None:
-    """Entry point for cmkcpiodir"""
-
-    # Load configuration
-    config = read_config()
 
-    # Arguments
+@functools.lru_cache()
+def _cmkcpiodir_parser() -> argparse.ArgumentParser:
+    """Create the parser for cmkcpiodir"""
     parser = argparse.ArgumentParser(
         description="Build an initramfs using a directory.",
         parents=(_common_parser_cmkcpio(),)
@@ -632,9 +762,23 @@ def entry_cmkcpiodir() -> None:
         '--build-dir', '-b', type=str, default='/tmp/initramfs',
         help="set the location of the initramfs directory"
     )
-    args = parser.parse_args(
-        shlex.split(config.cmkcpiodir_opts, posix=True) + sys.argv[1:]
+    parser.add_argument(
+        '--bsdtar', action="store_true", default=False,
+        help="create the CPIO archive with bsdtar instead of cpio"
     )
+    return parser
+
+
+def entry_cmkcpiodir() -> None:
+    """Entry point for cmkcpiodir"""
+
+    # Load configuration
+    config = read_config()
+
+    # Arguments
+    default_opts = shlex.split(config.cmkcpiodir_opts, posix=True) \
+        if config.cmkcpiodir_opts.strip() else []
+    args = _cmkcpiodir_parser().parse_args(default_opts + sys.argv[1:])
 
     _set_logging_level(args.verbose, args.quiet)
 
@@ -650,19 +794,18 @@ def entry_cmkcpiodir() -> None:
         with open(config.keymap[1], 'wb') as keymap_bin:
             mkramfs.keymap_build(
                 config.keymap[0], keymap_bin,
-                unicode=(locale.getdefaultlocale()[1] == 'UTF-8')
+                unicode=is_utf8_locale(),
             )
 
     # Init
-    with open(config.init_path, 'w') as init_file:
-        mkinit(
-            out=init_file,
-            root=config.root,
-            mounts=config.mounts,
-            keymap=(None if config.keymap is None else config.keymap[2]),
-            modules=(None if args.no_kmod else config.modules),
-            scripts=config.scripts,
-        )
+    mkinit_to_path(
+        path=config.init_path,
+        root=config.root,
+        mounts=config.mounts,
+        keymap=(None if config.keymap is None else config.keymap[2]),
+        modules=(None if args.no_kmod else config.modules),
+        scripts=config.scripts,
+    )
 
     # Initramfs
     if not args.only_build_archive:
@@ -674,13 +817,13 @@ def entry_cmkcpiodir() -> None:
             binroot=args.binroot,
             kernels=(() if args.no_kmod else args.kernel),
         )
-        _build_initramfs(initramfs, config)
+        _build_initramfs(initramfs, config, args.hash_cache)
 
     if not args.only_build_archive:
         # Pre-build cleanup
         if args.clean and os.path.exists(args.build_dir):
             logger.warning("Overwriting %s", args.build_dir)
-            shutil.rmtree(args.build_dir)
+            _remove_tree(args.build_dir)
 
         # Build
         logger.info("Building initramfs to directory %s", args.build_dir)
@@ -691,20 +834,13 @@ def entry_cmkcpiodir() -> None:
         # Create CPIO archive
         logger.info("Generating CPIO archive to %s from %s",
                     args.output, args.build_dir)
-        if args.output == '-':
-            mkramfs.mkcpio_from_dir(args.build_dir, sys.stdout.buffer)
-        else:
-            with open(args.output, 'wb') as cpiodest:
-                mkramfs.mkcpio_from_dir(args.build_dir, cpiodest)
+        with _open_archive(args.output, args.zstd) as cpiodest:
+            mkramfs.mkcpio_from_dir(args.build_dir, cpiodest,
+                                    bsdtar=args.bsdtar)
 
     if not args.keep:
         # Cleanup temporary files
-        if os.path.exists(args.build_dir):
-            logger.info("Cleaning %s", args.build_dir)
-            shutil.rmtree(args.build_dir)
-        if config.keymap is not None and os.path.exists(config.keymap[1]):
-            logger.info("Cleaning %s", config.keymap[1])
-            os.remove(config.keymap[1])
-        if os.path.exists(config.init_path):
-            logger.info("Cleaning %s", config.init_path)
-            os.remove(config.init_path)
+        _cleanup(args.build_dir, directory=True)
+        if config.keymap is not None:
+            _cleanup(config.keymap[1])
+        _cleanup(config.init_path)
@@ -35,13 +35,15 @@ it should always assign a default value if not set.
 
 from __future__ import annotations
 
+import functools
+import io
 import itertools
-import locale
 from enum import Enum, auto
 from shlex import quote
-from typing import Iterable, IO, Mapping, Optional
+from typing import Dict, Iterable, IO, Mapping, Optional, Set, Type
 
 from .data import Data
+from .utils import is_utf8_locale
 
 
 #: Global Busybox applet dependencies
@@ -56,8 +58,10 @@ BUSYBOX_KEYMAP_DEPS = {'loadkmap', 'kbd_mode'}
 BUSYBOX_KMOD_DEPS = {'depmod', 'modprobe'}
 
 #: Get a quoted TAB character
+#: (kept for compatibility, the generated script uses a literal tab)
 TAB = '"$(printf \'\\t\')"'
 #: Get a quoted EOL character
+#: (kept for compatibility, no longer used by the generated script)
 EOL = '"$(printf \'\\n\\b\')"'
 
 
@@ -88,6 +92,28 @@ class Breakpoint(Enum):
     #: Alias: ``mounts``.
     MOUNT = auto()
 
+    #: Environment variable enabling the breakpoint (e.g. ``RD_BREAK_INIT``)
+    env_var: str
+    #: Shell check written by :func:`do_break`, with its message pre-quoted
+    _check: str
+
+    def __init__(self, *args: object):
+        self.env_var = f'RD_BREAK_{self.name}'
+        self._check = f'[ -n "${{{self.env_var}+x}}" ] && notice ' \
+            f'{quote(f"Reached {self}")} && rescue_shell\n\n'
+
+
+#: Body of :func:`_fun_rescue_shell`
+_FUN_RESCUE_SHELL = ''.join((
+    "rescue_shell()\n",
+    "{\n",
+    "\tlog 0 'Dropping into a shell'\n",
+    "\texec /bin/sh 0<>/dev/console 1<>/dev/console 2<>/dev/console\n",
+    "\temerg 'Failed to start rescue shell'\n",
+    "\tpanic\n"
+    "}\n\n",
+))
+
 
 def _fun_rescue_shell(out: IO[str]) -> None:
     """Define the rescue_shell function
@@ -102,15 +128,18 @@ def _fun_rescue_shell(out: IO[str]) -> None:
 
     :param out: Stream to write into
     """
-    out.writelines((
-        "rescue_shell()\n",
-        "{\n",
-        "\tlog 0 'Dropping into a shell'\n",
-        "\texec /bin/sh 0<>/dev/console 1<>/dev/console 2<>/dev/console\n",
-        "\temerg 'Failed to start rescue shell'\n",
-        "\tpanic\n"
-        "}\n\n",
-    ))
+    out.write(_FUN_RESCUE_SHELL)
+
+
+#: Body of :func:`_fun_panic`
+_FUN_PANIC = ''.join((
+    "panic()\n",
+    "{\n",
+    "\tlog 0 'Terminating init'\n",
+    "\tsync\n",
+    "\texit\n",
+    "}\n\n",
+))
 
 
 def _fun_panic(out: IO[str]) -> None:
@@ -126,14 +155,18 @@ def _fun_panic(out: IO[str]) -> None:
 
     :param out: Stream to write into
     """
-    out.writelines((
-        "panic()\n",
-        "{\n",
-        "\tlog 0 'Terminating init'\n",
-        "\tsync\n",
-        "\texit\n",
-        "}\n\n",
-    ))
+    out.write(_FUN_PANIC)
+
+
+#: Body of :func:`_fun_die`
+_FUN_DIE = ''.join((
+    "die()\n",
+    "{\n",
+    "\temerg \"$@\"\n",
+    "\tkill -TERM -1 || err \'Failed to kill all processes\'\n",
+    "\t[ -n \"${RD_PANIC+x}\" ] && panic || rescue_shell\n",
+    "}\n\n",
+))
 
 
 def _fun_die(out: IO[str]) -> None:
@@ -150,14 +183,31 @@ def _fun_die(out: IO[str]) -> None:
 
     :param out: Stream to write into
     """
-    out.writelines((
-        "die()\n",
-        "{\n",
-        "\temerg \"$@\"\n",
-        "\tkill -TERM -1 || err \'Failed to kill all processes\'\n",
-        "\t[ -n \"${RD_PANIC+x}\" ] && panic || rescue_shell\n",
-        "}\n\n",
-    ))
+    out.write(_FUN_DIE)
+
+
+#: Body of :func:`_fun_log`
+_FUN_LOG = ''.join((
+    'log()\n',
+    '{\n',
+    '\t[ "${1-}" -lt 8 ] && lvl="$1" && shift || lvl=1\n',
+    '\t[ $# -ge 1 ] || return 0\n',
+    '\techo "<$((24 | lvl))>initramfs:" "$@" 1>/dev/kmsg\n',
+    '\tif [ "${lvl}" -eq 5 ] || [ "${lvl}" -eq 6 ] ',
+    '&& [ -z "${RD_QUIET+x}" ] || [ -n "${RD_DEBUG+x}" ] ',
+    '|| [ "${lvl}" -le 4 ]\n',
+    '\tthen echo "$@" 1>&2\n',
+    '\tfi\n',
+    '\treturn 0\n',
+    '}\n',
+    '\n',
+    "for log_def in 'emerg 0 FATAL:' 'alert 1 ERROR:' 'crit 2 ERROR:' ",
+    "'err 3 ERROR:' 'warn 4 ERROR:' 'notice 5' 'info 6' 'debug 7'; do\n",
+    '\teval "${log_def%% *}() { log ${log_def#* } \\"\\$@\\" ; }"\n',
+    'done\n',
+    'unset log_def\n',
+    '\n',
+))
 
 
 def _fun_log(out: IO[str]) -> None:
@@ -196,30 +246,21 @@ def _fun_log(out: IO[str]) -> None:
 
     :param out: Stream to write into
     """
-    out.writelines((
-        'log()\n',
-        '{\n',
-        '\t[ "${1-}" -lt 8 ] && lvl="$1" && shift || lvl=1\n',
-        '\t[ $# -ge 1 ] || return 0\n',
-        '\techo "<$((24 | lvl))>initramfs:" "$@" 1>/dev/kmsg\n',
-        '\tif [ "${lvl}" -eq 5 ] || [ "${lvl}" -eq 6 ] ',
-        '&& [ -z "${RD_QUIET+x}" ] || [ -n "${RD_DEBUG+x}" ] ',
-        '|| [ "${lvl}" -le 4 ]\n',
-        '\tthen echo "$@" 1>&2\n',
-        '\tfi\n',
-        '\treturn 0\n',
-        '}\n',
-        '\n',
-        'emerg() { log 0 \'FATAL:\' "$@" ; }\n',
-        'alert() { log 1 \'ERROR:\' "$@" ; }\n',
-        'crit() { log 2 \'ERROR:\' "$@" ; }\n',
-        'err() { log 3 \'ERROR:\' "$@" ; }\n',
-        'warn() { log 4 \'ERROR:\' "$@" ; }\n',
-        'notice() { log 5 "$@" ; }\n',
-        'info() { log 6 "$@" ; }\n',
-        'debug() { log 7 "$@" ; }\n',
-        '\n',
-    ))
+    out.write(_FUN_LOG)
+
+
+#: Template of :func:`do_header`, with quoted ``home`` and ``path``
+_HEADER_TPL = \
+    "#!/bin/sh\n\nHOME={home}\nexport HOME\nPATH={path}\nexport PATH\n\n"
+#: Global functions defined by :func:`do_header`
+_HEADER_FUNCTIONS = _FUN_RESCUE_SHELL + _FUN_PANIC + _FUN_DIE + _FUN_LOG
+
+
+@functools.lru_cache()
+def _header(home: str, path: str) -> str:
+    """Get the text written by :func:`do_header`, built once per arguments"""
+    return _HEADER_TPL.format(home=quote(home), path=quote(path)) \
+        + _HEADER_FUNCTIONS
 
 
 def do_header(out: IO[str], home: str = '/root', path: str = '/bin:/sbin') \
@@ -234,19 +275,25 @@ def do_header(out: IO[str], home: str = '/root', path: str = '/bin:/sbin') \
     :param home: ``HOME`` environment variable
     :param path: ``PATH`` environment variable
     """
-    out.writelines((
-        "#!/bin/sh\n",
-        "\n",
-        f"HOME={quote(home)}\n",
-        "export HOME\n",
-        f"PATH={quote(path)}\n",
-        "export PATH\n",
-        "\n",
-    ))
-    _fun_rescue_shell(out)
-    _fun_panic(out)
-    _fun_die(out)
-    _fun_log(out)
+    out.write(_header(home, path))
+
+
+#: Body of :func:`do_init`
+_DO_INIT = (
+    "debug 'Initialization'\n"
+    "test $$ -eq 1 || die 'init expects to be run as PID 1'\n"
+    "for vfs in 'proc /proc' 'sysfs /sys' 'devtmpfs /dev'; do\n"
+    '\tmount -t "${vfs%% *}" none "${vfs#* }" || '
+    'die "Failed to mount ${vfs#* }"\n'
+    'done\n'
+    'unset vfs\n'
+    'PRINTK="$(cut -d\'\t\' -f1 -s /proc/sys/kernel/printk)"\n'
+    "echo 4 1>/proc/sys/kernel/printk || "
+    "err 'Failed to set kernel log level to 4'\n"
+    '[ ! -d "/lib/modules/$(uname -r)" ] || depmod || '
+    "warn 'Failed to generate modules.dep'\n"
+    "\n"
+)
 
 
 def do_init(out: IO[str]) -> None:
@@ -258,19 +305,54 @@ def do_init(out: IO[str]) -> None:
 
     :param out: Stream to write into
     """
-    out.writelines((
-        "debug 'Initialization'\n",
-        "test $$ -eq 1 || die 'init expects to be run as PID 1'\n",
-        "mount -t proc none /proc || die 'Failed to mount /proc'\n",
-        "mount -t sysfs none /sys || die 'Failed to mount /sys'\n",
-        "mount -t devtmpfs none /dev || die 'Failed to mount /dev'\n",
-        'PRINTK="$(cut -d', TAB, ' -f1 -s /proc/sys/kernel/printk)"\n',
-        "echo 4 1>/proc/sys/kernel/printk || ",
-        'err \'Failed to set kernel log level to 4\'\n'
-        '[ ! -d "/lib/modules/$(uname -r)" ] || depmod || ',
-        'warn \'Failed to generate modules.dep\'\n',
-        "\n",
-    ))
+    out.write(_DO_INIT)
+
+
+#: Body of :func:`do_cmdline`
+_DO_CMDLINE = ''.join((
+    "debug 'Parsing command-line'\n",
+    "parse_cmdline()\n",
+    "{\n",
+    "\tread -r cmdline_all </proc/cmdline\n",
+    "\tfor cmdline in ${cmdline_all-}; do\n",
+    "\t\tcase \"${cmdline}\" in\n",
+    "\t\t--) break ;;\n",
+    "\t\tinit=*) INIT=\"${cmdline#*=}\" ;;\n"
+    "\t\tdebug) RD_DEBUG=true ;;\n",
+    "\t\tquiet) RD_QUIET=true ;;\n",
+    "\t\trd.break) RD_BREAK_ROOTFS=true ;;\n",
+    "\t\trd.break=*)\n",
+    "\t\t\tbpoints=\"${cmdline#*=},\"\n",
+    "\t\t\twhile [ -n \"${bpoints}\" ]; do\n",
+    "\t\t\t\tbpoint=\"${bpoints%%,*}\"\n",
+    "\t\t\t\tbpoints=\"${bpoints#*,}\"\n",
+    "\t\t\t\tcase \"${bpoint}\" in\n",
+    "\t\t\t\tinit) RD_BREAK_INIT=true ;;\n",
+    "\t\t\t\tmodule|modules) RD_BREAK_MODULE=true ;;\n",
+    "\t\t\t\trootfs) RD_BREAK_ROOTFS=true ;;\n",
+    "\t\t\t\tmount|mounts) RD_BREAK_MOUNT=true ;;\n",
+    "\t\t\t\t'') ;;\n",
+    "\t\t\t\t*) err \"Unknown breakpoint ${bpoint}\" ;;\n",
+    "\t\t\t\tesac\n",
+    "\t\t\tdone\n",
+    "\t\t\t;;\n",
+    "\t\trd.debug) RD_DEBUG=true ;;\n",
+    "\t\trd.panic) RD_PANIC=true ;;\n",
+    "\t\trd.quiet) RD_QUIET=true ;;\n",
+    "\t\t*) set -- \"$@\" \"${cmdline}\" ;;\n",
+    "\t\tesac\n",
+    "\tdone\n",
+    "\tunset cmdline_all\n",
+    "\t[ $# -eq 0 ] || debug \"Skipped unknown cmdlines: $*\"\n",
+    "}\n",
+    "parse_cmdline\n",
+    "\n",
+    "[ -n \"${RD_DEBUG+x}\" ] && [ -z \"${RD_QUIET+x}\" ] ",
+    "&& PS4='+ $0:$LINENO: ' && set -x\n",
+    "[ -n \"${RD_DEBUG+x}\" ] || exec 1<>/dev/null || ",
+    "err 'Failed to redirect stdout to /dev/null'\n",
+    "\n",
+))
 
 
 def do_cmdline(out: IO[str]) -> None:
@@ -278,6 +360,8 @@ def do_cmdline(out: IO[str]) -> None:
 
     Note: the command line is parsed up to "--", arguments after this
     are passed through to the final init process.
+    Parsing is done in the ``parse_cmdline`` function, which collects
+    unknown parameters in its own positional parameters.
 
     Parsed parameters:
 
@@ -295,45 +379,22 @@ def do_cmdline(out: IO[str]) -> None:
 
     :param out: Stream to write into
     """
-    out.writelines((
-        "debug 'Parsing command-line'\n",
-        "for cmdline in $(cat /proc/cmdline); do\n",
-        "\tcase \"${cmdline}\" in\n",
-        "\t--) break ;;\n",
-        "\tinit=*) INIT=\"${cmdline#*=}\" ;;\n"
-        "\tdebug) RD_DEBUG=true ;;\n",
-        "\tquiet) RD_QUIET=true ;;\n",
-        "\trd.break) RD_BREAK_ROOTFS=true ;;\n",
-        "\trd.break=*)\n",
-        "\t\told_ifs=\"${IFS}\"\n",
-        "\t\tIFS=','\n",
-        "\t\tfor bpoint in ${cmdline#*=}; do\n",
-        "\t\t\tcase \"${bpoint}\" in\n",
-        "\t\t\tinit) RD_BREAK_INIT=true ;;\n",
-        "\t\t\tmodule|modules) RD_BREAK_MODULE=true ;;\n",
-        "\t\t\trootfs) RD_BREAK_ROOTFS=true ;;\n",
-        "\t\t\tmount|mounts) RD_BREAK_MOUNT=true ;;\n",
-        "\t\t\t*) err \"Unknown breakpoint ${bpoint}\" ;;\n",
-        "\t\t\tesac\n",
-        "\t\tdone\n",
-        "\t\tIFS=\"${old_ifs}\"\n",
-        "\t\t;;\n",
-        "\trd.debug) RD_DEBUG=true ;;\n",
-        "\trd.panic) RD_PANIC=true ;;\n",
-        "\trd.quiet) RD_QUIET=true ;;\n",
-        "\t*) unknown_cmd=\"${unknown_cmd-}${unknown_cmd+ }${cmdline}\" ;;\n",
-        "\tesac\n",
-        "done\n",
-        "\n",
-        "[ -n \"${RD_DEBUG+x}\" ] && [ -z \"${RD_QUIET+x}\" ] ",
-        "&& PS4='+ $0:$LINENO: ' && set -x\n",
-        "[ -n \"${unknown_cmd+x}\" ] ",
-        "&& debug \"Skipped unknown cmdlines: ${unknown_cmd}\"\n",
-        "unset unknown_cmd\n",
-        "[ -n \"${RD_DEBUG+x}\" ] || exec 1<>/dev/null || ",
-        "err 'Failed to redirect stdout to /dev/null'\n",
-        "\n",
-    ))
+    out.write(_DO_CMDLINE)
+
+
+#: Template of :func:`do_keymap`, with quoted ``file`` and error messages
+_KEYMAP_TPL = (
+    "info 'Loading keymap'\n"
+    "[ -f {file} ] || err {err_file}\n"
+    "{mode}"
+    "loadkmap <{file} || crit {err_load}\n"
+    "\n"
+)
+#: Keyboard mode command of :func:`do_keymap`, indexed by ``unicode``
+_KEYMAP_MODE = {
+    True: "kbd_mode -u || crit 'Failed to set keyboard mode to unicode'\n",
+    False: "kbd_mode -a || crit 'Failed to set keyboard mode to ASCII'\n",
+}
 
 
 def do_keymap(out: IO[str], keymap_file: str, unicode: bool = True) -> None:
@@ -343,16 +404,11 @@ def do_keymap(out: IO[str], keymap_file: str, unicode: bool = True) -> None:
     :param keymap_file: Absolute path of the file to load
     :param unicode: Set the keyboard in unicode mode (rather than ASCII)
     """
-    mode = 'unicode' if unicode else 'ASCII'
-    out.writelines((
-        "info 'Loading keymap'\n",
-        f"[ -f {quote(keymap_file)} ] || err ",
-        quote(f'Keymap file {keymap_file} not found'), '\n',
-        f"kbd_mode {'-u' if unicode else '-a'} || crit ",
-        quote(f'Failed to set keyboard mode to {mode}'), '\n',
-        f"loadkmap <{quote(keymap_file)} || crit ",
-        quote(f'Failed to load keymap {keymap_file}'), '\n',
-        "\n",
+    out.write(_KEYMAP_TPL.format(
+        file=quote(keymap_file),
+        err_file=quote(f'Keymap file {keymap_file} not found'),
+        err_load=quote(f'Failed to load keymap {keymap_file}'),
+        mode=_KEYMAP_MODE[unicode],
     ))
 
 
@@ -363,18 +419,18 @@ def do_module(out: IO[str], module: str, *args: str) -> None:
     :param module: Name of the module to load
     :param args: Arguments for the module (passed to ``modprobe``)
     """
-    quoted_args = (f'{quote(arg)} ' for arg in args)
     search = quote(f'/{module.replace("_", "-")}\\.ko')
+    modprobe = ' '.join(map(quote, (module, *args)))
 
-    out.writelines((
+    out.write(
         'if cat "/lib/modules/$(uname -r)/modules.builtin" 2>/dev/null | '
-        f'tr _ - | grep -q {search}; then\n',
-        f"\tinfo 'Loading kernel module {module}'\n",
-        f"\tmodprobe {quote(module)} ", *quoted_args, '|| crit ',
-        quote(f'Failed to load module {module}'), '\n',
-        'fi\n',
-        '\n',
-    ))
+        f'tr _ - | grep -q {search}; then\n'
+        f"\tinfo 'Loading kernel module {module}'\n"
+        f"\tmodprobe {modprobe} || crit "
+        f"{quote(f'Failed to load module {module}')}\n"
+        'fi\n'
+        '\n'
+    )
 
 
 def do_break(out: IO[str], breakpoint_: Breakpoint,
@@ -385,29 +441,45 @@ def do_break(out: IO[str], breakpoint_: Breakpoint,
     :param breakpoint_: Which breakpoint to check
     :param scripts: User commands to run before the breakpoint
     """
-    if breakpoint_ is Breakpoint.EARLY:
-        breakname = 'RD_BREAK_EARLY'
-    elif breakpoint_ is Breakpoint.INIT:
-        breakname = 'RD_BREAK_INIT'
-    elif breakpoint_ is Breakpoint.MODULE:
-        breakname = 'RD_BREAK_MODULE'
-    elif breakpoint_ is Breakpoint.ROOTFS:
-        breakname = 'RD_BREAK_ROOTFS'
-    elif breakpoint_ is Breakpoint.MOUNT:
-        breakname = 'RD_BREAK_MOUNT'
-    else:
-        raise ValueError(f"Unknown breakpoint: {breakpoint_}")
+    try:
+        check = breakpoint_._check
+    except AttributeError:
+        raise ValueError(f"Unknown breakpoint: {breakpoint_}") from None
 
     if scripts:
-        out.write(f"info 'Running user scripts for {breakpoint_}'\n")
-        for script in scripts:
-            out.writelines((script, "\n"))
-        out.write("\n")
-    out.writelines((
-        "[ -n \"${", breakname, "+x}\" ] && notice ",
-        quote(f"Reached {breakpoint_}"), " && rescue_shell\n"
-        "\n",
-    ))
+        out.write(f"info 'Running user scripts for {breakpoint_}'\n"
+                  + ''.join(f'{script}\n' for script in scripts)
+                  + '\n' + check)
+    else:
+        out.write(check)
+
+
+#: Body of :func:`do_switch_root`, up to the new root path
+_DO_SWITCH_ROOT_PREFIX = (
+    'info "Run ${INIT} as init process"\n'
+    "debug '  with arguments:'\n"
+    'for arg in "${INIT}" "$@"; do debug "    ${arg}"; done\n'
+    "debug '  with environment:'\n"
+    'env | while IFS= read -r var; do debug "    ${var}"; done\n'
+    '\n'
+    '[ -z "${PRINTK+x}" ] && PRINTK='
+    '"$(cut -d\'\t\' -f4 -s /proc/sys/kernel/printk)"\n'
+    'echo "${PRINTK}" 1>/proc/sys/kernel/printk || '
+    'err "Failed to restore kernel log level to ${PRINTK}"\n'
+    'exec 0<>/dev/console 1<>/dev/console 2<>/dev/console || '
+    "err 'Failed to restore input/output to console'\n"
+    "kill -TERM -1 || err 'Failed to kill all processes'\n"
+    "umount -l /dev || err 'Failed to unmount /dev'\n"
+    "umount -l /proc || err 'Failed to unmount /proc'\n"
+    "umount -l /sys || err 'Failed to unmount /sys'\n"
+    'exec switch_root '
+)
+#: Body of :func:`do_switch_root`, after the new root path
+_DO_SWITCH_ROOT_SUFFIX = (
+    ' "${INIT}" "$@"\n'
+    "die 'Failed to switch root'\n"
+    "\n"
+)
 
 
 def do_switch_root(out: IO[str], newroot: Data, init: str = '/sbin/init') \
@@ -424,31 +496,69 @@ def do_switch_root(out: IO[str], newroot: Data, init: str = '/sbin/init') \
     :param newroot: Data to use as new root
     :param init: Init process to execute from the new root
     """
-    out.writelines((
-        '[ -z "${INIT+x}" ] && INIT=', quote(init), '\n',
-        'info "Run ${INIT} as init process"\n',
-        'debug \'  with arguments:\'\n',
-        'for arg in "${INIT}" "$@"; do debug "    ${arg}"; done\n',
-        'debug \'  with environment:\'\n',
-        'old_ifs="${IFS}"\n',
-        'IFS=', EOL, '\n',
-        'for var in $(env); do debug "    ${var}"; done\n',
-        'IFS="${old_ifs}"\n',
-        '\n',
-        '[ -z "${PRINTK+x}" ] && PRINTK=',
-        '"$(cut -d', TAB, ' -f4 -s /proc/sys/kernel/printk)"\n',
-        'echo "${PRINTK}" 1>/proc/sys/kernel/printk || ',
-        'err "Failed to restore kernel log level to ${PRINTK}"\n',
-        'exec 0<>/dev/console 1<>/dev/console 2<>/dev/console || ',
-        'err \'Failed to restore input/output to console\'\n',
-        'kill -TERM -1 || err \'Failed to kill all processes\'\n',
-        "umount -l /dev || err 'Failed to unmount /dev'\n",
-        "umount -l /proc || err 'Failed to unmount /proc'\n",
-        "umount -l /sys || err 'Failed to unmount /sys'\n",
-        'exec switch_root ', newroot.path(), ' "${INIT}" "$@"\n',
-        "die 'Failed to switch root'\n",
-        "\n",
-    ))
+    out.write(
+        f'[ -z "${{INIT+x}}" ] && INIT={quote(init)}\n'
+        f'{_DO_SWITCH_ROOT_PREFIX}{newroot.path()}{_DO_SWITCH_ROOT_SUFFIX}'
+    )
+
+
+def _datatypes(tops: Iterable[Data]) -> Dict[Type[Data], None]:
+    """Get the data types used by some data and their dependencies
+
+    Shared dependencies are only walked once.
+
+    :param tops: Data to walk
+    :return: Ordered set of data types, in order of first appearance
+    """
+    seen: Set[int] = set()
+    return dict.fromkeys(
+        type(data)
+        for top in tops
+        for data in itertools.chain((top,), top.iter_all_deps(seen))
+    )
+
+
+def _mkinit(
+        root: Data,
+        mounts: Iterable[Data] = (),
+        keymap: Optional[str] = None,
+        modules: Optional[Mapping[str, Iterable[str]]] = None,
+        scripts: Optional[Mapping[Breakpoint, Iterable[str]]] = None,
+        ) -> str:  # noqa: E123
+    """Generate the init script, see :func:`mkinit`
+
+    :return: Content of the init script
+    """
+    mounts = tuple(mounts)
+    datatypes = _datatypes((root, *mounts))
+    modules = {} if modules is None \
+        else {mod: tuple(args) for mod, args in modules.items()}
+    user_scripts = {} if scripts is None else scripts
+    scripts = {bpoint: tuple(user_scripts.get(bpoint, ()))
+               for bpoint in Breakpoint}
+    # The locale only matters for the keymap
+    unicode = keymap is not None and is_utf8_locale()
+
+    buf = io.StringIO()
+    do_header(buf)
+    do_break(buf, Breakpoint.EARLY, scripts[Breakpoint.EARLY])
+    do_init(buf)
+    do_cmdline(buf)
+    if keymap is not None:
+        do_keymap(buf, keymap, unicode=unicode)
+    for datatype in datatypes:
+        datatype.initialize(buf)
+    do_break(buf, Breakpoint.INIT, scripts[Breakpoint.INIT])
+    for mod_name, mod_args in modules.items():
+        do_module(buf, mod_name, *mod_args)
+    do_break(buf, Breakpoint.MODULE, scripts[Breakpoint.MODULE])
+    root.load(buf)
+    do_break(buf, Breakpoint.ROOTFS, scripts[Breakpoint.ROOTFS])
+    for mount in mounts:
+        mount.load(buf)
+    do_break(buf, Breakpoint.MOUNT, scripts[Breakpoint.MOUNT])
+    do_switch_root(buf, root)
+    return buf.getvalue()
 
 
 def mkinit(
@@ -461,6 +571,8 @@ def mkinit(
         ) -> None:  # noqa: E123
     """Create the init script
 
+    The script is generated in memory, then written into ``out`` at once.
+
     :param out: Stream to write into
     :param root: :class:`Data` to use as rootfs
     :param mounts: :class:`Data` needed in addition of rootfs
@@ -472,33 +584,42 @@ def mkinit(
         ``breakpoint`` is the :class:`Breakpoint` where the commands will
         be run. ``commands`` is the iterable with the commands.
     """
+    out.write(_mkinit(root, mounts, keymap, modules, scripts))
 
-    datatypes = set()
-    for data in itertools.chain((root,), mounts):
-        datatypes.add(type(data))
-        for dep in data.iter_all_deps():
-            datatypes.add(type(dep))
-    if modules is None:
-        modules = {}
-    if scripts is None:
-        scripts = {}
-
-    do_header(out)
-    do_break(out, Breakpoint.EARLY, scripts.get(Breakpoint.EARLY, ()))
-    do_init(out)
-    do_cmdline(out)
-    if keymap is not None:
-        do_keymap(out, keymap,
-                  unicode=(locale.getdefaultlocale()[1] == 'UTF-8'))
-    for datatype in datatypes:
-        datatype.initialize(out)
-    do_break(out, Breakpoint.INIT, scripts.get(Breakpoint.INIT, ()))
-    for mod_name, mod_args in modules.items():
-        do_module(out, mod_name, *mod_args)
-    do_break(out, Breakpoint.MODULE, scripts.get(Breakpoint.MODULE, ()))
-    root.load(out)
-    do_break(out, Breakpoint.ROOTFS, scripts.get(Breakpoint.ROOTFS, ()))
-    for mount in mounts:
-        mount.load(out)
-    do_break(out, Breakpoint.MOUNT, scripts.get(Breakpoint.MOUNT, ()))
-    do_switch_root(out, root)
+
+def mkinit_bytes(
+        out: IO[bytes],
+        root: Data,
+        mounts: Iterable[Data] = (),
+        keymap: Optional[str] = None,
+        modules: Optional[Mapping[str, Iterable[str]]] = None,
+        scripts: Optional[Mapping[Breakpoint, Iterable[str]]] = None,
+        ) -> None:  # noqa: E123
+    """Create the init script into a binary stream
+
+    Same as :func:`mkinit`, the generated script is UTF-8 encoded at once
+    before being written into ``out``.
+
+    :param out: Binary stream to write into
+    """
+    out.write(_mkinit(root, mounts, keymap, modules, scripts).encode())
+
+
+def mkinit_to_path(
+        path: str,
+        root: Data,
+        mounts: Iterable[Data] = (),
+        keymap: Optional[str] = None,
+        modules: Optional[Mapping[str, Iterable[str]]] = None,
+        scripts: Optional[Mapping[Breakpoint, Iterable[str]]] = None,
+        ) -> None:  # noqa: E123
+    """Create the init script into a file
+
+    Same as :func:`mkinit_bytes`, the file is opened in binary mode
+    and the script is written with a single call.
+    Callers writing the init script to a file should prefer this function.
+
+    :param path: Path of the file to write into
+    """
+    with open(path, 'wb') as out:
+        mkinit_bytes(out, root, mounts, keymap, modules, scripts)
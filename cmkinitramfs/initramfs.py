@@ -12,19 +12,32 @@ The main function is :func:`mkinitramfs` to build the complete initramfs.
 
 from __future__ import annotations
 
+import contextlib
+import functools
 import logging
 import os
 import os.path
 import platform
+import re
+import stat
 import subprocess
-from typing import IO, Iterable, Iterator, List, Optional, Set, Tuple
+import sys
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
+from typing import (
+    IO, Any, Callable, Dict, FrozenSet, Hashable, Iterable, Iterator, List,
+    Optional, Set, Tuple, TypeVar,
+)
 
-from .bin import (find_elf_deps_set, find_kmod, find_kmod_deps,
+from elftools.common.exceptions import ELFError
+
+from .bin import (clear_caches, find_elf_deps_set, find_kmod, find_kmod_deps,
                   find_exec, find_lib)
 from .item import Directory, File, Item, MergeError, Node, Symlink
-from .utils import hash_file, normpath, removeprefix
+from .utils import hash_file, normpath
 
 logger = logging.getLogger(__name__)
+_T = TypeVar('_T')
 #: Set of shell special built-in commands.
 #: They are guaranteed to be available in the initramfs' ``/bin/sh``.
 SHELL_SPECIAL_BUILTIN = frozenset((
@@ -37,6 +50,14 @@ SHELL_RESERVED_WORDS = frozenset((
     '!', '{', '}', 'case', 'do', 'done', 'elif', 'else', 'esac', 'fi', 'for',
     'if', 'in', 'then', 'until', 'while',
 ))
+#: Prefixes stripped from initramfs paths, ``/usr/local`` first
+_USR_PREFIXES = ('/usr/local/', '/usr/')
+#: Match whitespaces, which are not supported by ``gen_init_cpio``
+_WHITESPACE = re.compile(r'\s')
+#: :class:`subprocess.Popen` arguments for pipes carrying large inputs,
+#: a bigger pipe needs less system calls (Python >= 3.10)
+_LARGE_PIPE: Dict[str, Any] = \
+    {'pipesize': 1 << 20} if sys.version_info >= (3, 10) else {}
 
 
 def busybox_get_applets(busybox_exec: str) -> Iterator[str]:
@@ -48,36 +69,76 @@ def busybox_get_applets(busybox_exec: str) -> Iterator[str]:
     """
     cmd = (busybox_exec, '--list-full')
     logger.debug("Subprocess: %s", cmd)
-    with subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc:
-        assert proc.stdout is not None
-        for line in proc.stdout:
-            yield '/' + line.decode().strip()
-        if proc.wait() != 0:
-            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+    # Read and decode the whole list at once
+    output = subprocess.check_output(cmd, stdin=subprocess.DEVNULL, text=True)
+    for line in output.splitlines():
+        yield '/' + line.strip()
+
+
+@functools.lru_cache()
+def _busybox_applets(busybox_exec: str) -> Tuple[str, ...]:
+    """Get BusyBox applets (cached)
+
+    See :func:`busybox_get_applets`.
+    """
+    return tuple(busybox_get_applets(busybox_exec))
 
 
-def mkcpio_from_dir(src: str, dest: IO[bytes]) -> None:
+def mkcpio_from_dir(src: str, dest: IO[bytes], bsdtar: bool = False) \
+        -> None:
     """Create CPIO archive from a given directory
 
+    By default, the directory is walked in-process and the file list is
+    passed to ``cpio``. With ``bsdtar``, ``bsdtar`` (libarchive) walks
+    the directory and writes the archive in a single process.
+
     :param src: Directory from which the archive is created
     :param dest: Destination stream of the CPIO data
-    :raises subprocess.CalledProcessError: Error during ``find`` or ``cpio``
+    :param bsdtar: Use ``bsdtar`` instead of ``cpio``
+    :raises subprocess.CalledProcessError: Error during ``bsdtar``
+        or ``cpio``
+    :raises OSError: Cannot list the content of ``src``
     """
-    logger.debug("Creating CPIO archive")
+    cmd: Tuple[str, ...]
+    if bsdtar:
+        logger.debug("Creating CPIO archive with bsdtar")
+        cmd = ('bsdtar', '--format', 'newc', '-cf', '-', '.')
+        logger.debug("Subprocess: %s", cmd)
+        subprocess.check_call(cmd, stdin=subprocess.DEVNULL, stdout=dest,
+                              cwd=src)
+        return
+
+    logger.debug("Creating CPIO archive with cpio")
+
+    def walk_error(err: OSError) -> None:
+        raise err
 
-    oldpwd = os.getcwd()
-    os.chdir(src)
-    cmd: Tuple[str, ...] = ("find", ".", "-print0")
+    cmd = ('cpio', '--quiet', '--null', '--create', '--format=newc')
     logger.debug("Subprocess: %s", cmd)
-    with subprocess.Popen(cmd, stdout=subprocess.PIPE) as find:
-        cmd = ('cpio', '--quiet', '--null', '--create', '--format=newc')
-        logger.debug("Subprocess: %s", cmd)
-        with subprocess.Popen(cmd, stdin=find.stdout, stdout=dest) as cpio:
-            if cpio.wait() != 0:
-                raise subprocess.CalledProcessError(cpio.returncode, cpio.args)
-        if find.wait() != 0:
-            raise subprocess.CalledProcessError(find.returncode, find.args)
-    os.chdir(oldpwd)
+    with subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=dest, cwd=src,
+                          **_LARGE_PIPE) as cpio:
+        assert cpio.stdin is not None
+        # Stream the files relative to src, parents before their content,
+        # cpio archives them while the directory is walked
+        top = os.fsencode(src)
+        try:
+            cpio.stdin.write(b'.\0')
+            for root, dirs, files in os.walk(top, onerror=walk_error):
+                rel = os.path.relpath(root, top)
+                prefix = b'./' if rel == b'.' else b'./' + rel + b'/'
+                cpio.stdin.write(b''.join(
+                    prefix + name + b'\0' for name in dirs + files
+                ))
+            cpio.stdin.close()
+        except BrokenPipeError:
+            # cpio exited early, its return code is checked below
+            with contextlib.suppress(BrokenPipeError):
+                cpio.stdin.close()
+        except BaseException:
+            cpio.kill()
+            raise
+    if cpio.returncode != 0:
+        raise subprocess.CalledProcessError(cpio.returncode, cpio.args)
 
 
 def mkcpio_from_list(src: str, dest: IO[bytes]) -> None:
@@ -89,7 +150,31 @@ def mkcpio_from_list(src: str, dest: IO[bytes]) -> None:
     """
     cmd = ('gen_init_cpio', src)
     logger.debug("Subprocess: %s", cmd)
-    subprocess.check_call(cmd, stdout=dest)
+    subprocess.check_call(cmd, stdin=subprocess.DEVNULL, stdout=dest)
+
+
+@contextlib.contextmanager
+def compress_zstd(dest: IO[bytes], level: int = 19) -> Iterator[IO[bytes]]:
+    """Compress a stream with ``zstd``
+
+    Data written to the returned stream is compressed using all CPU cores
+    and written to ``dest``. Linux loads initramfs compressed this way
+    if it is built with ``CONFIG_RD_ZSTD``.
+
+    :param dest: Destination stream of the compressed data
+    :param level: Compression level, from 1 to 19
+    :return: Stream to write the data to compress (e.g. as the ``dest``
+        of :func:`mkcpio_from_dir` or :func:`mkcpio_from_list`)
+    :raises subprocess.CalledProcessError: Error during ``zstd``
+    """
+    cmd = ('zstd', '--quiet', f'-{level}', '-T0', '--stdout')
+    logger.debug("Subprocess: %s", cmd)
+    with subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=dest,
+                          **_LARGE_PIPE) as zstd:
+        assert zstd.stdin is not None
+        yield zstd.stdin
+    if zstd.returncode != 0:
+        raise subprocess.CalledProcessError(zstd.returncode, zstd.args)
 
 
 def keymap_build(src: str, dest: IO[bytes], unicode: bool = True) -> None:
@@ -106,12 +191,15 @@ def keymap_build(src: str, dest: IO[bytes], unicode: bool = True) -> None:
     """
     cmd = ('loadkeys', '--unicode' if unicode else '--ascii', '--bkeymap', src)
     logger.debug("Subprocess: %s", cmd)
-    subprocess.check_call(cmd, stdout=dest)
+    subprocess.check_call(cmd, stdin=subprocess.DEVNULL, stdout=dest)
 
 
 class Initramfs:
     """An initramfs archive
 
+    The binary lookup caches are cleared when the initramfs is created
+    (see :func:`clear_caches`), so lookups reflect the current system.
+
     :param user: Default user to use when creating items
     :param group: Default group to use when creating items
     :param binroot: Root directory where binary files are found
@@ -135,13 +223,17 @@ class Initramfs:
             else {platform.release()}
         logger.debug("Target kernels: %s", self.kernels)
         self.items = []
+        self._paths: Dict[str, Item] = {}
+        self._merge_keys: Dict[Hashable, Item] = {}
+        self._added: Set[Tuple[str, str, Optional[int]]] = set()
+        clear_caches()
         self.__mklayout()
 
     def __mklayout(self) -> None:
         """Create the base layout of the initramfs"""
         logger.debug("Creating initramfs layout")
 
-        self.items.append(Directory(0o755, self.user, self.group, '/'))
+        self.__append(Directory(0o755, self.user, self.group, '/'), None)
 
         # Base layout
         self.add_item(Directory(0o755, self.user, self.group, '/bin'))
@@ -156,10 +248,14 @@ class Initramfs:
 
         # Only create /lib* if they exists on the current system
         for libdir in ["/lib", "/lib32", "/lib64"]:
-            if os.path.islink(libdir):
+            try:
+                libdir_mode = os.lstat(libdir).st_mode
+            except OSError:
+                continue
+            if stat.S_ISLNK(libdir_mode):
                 self.add_item(Symlink(0o777, self.user, self.group,
                                       libdir, os.readlink(libdir)))
-            elif os.path.isdir(libdir):
+            elif stat.S_ISDIR(libdir_mode):
                 self.add_item(Directory(0o755, self.user, self.group, libdir))
 
         # Create symlink /usr -> /
@@ -194,10 +290,7 @@ class Initramfs:
         :return: :data:`True` if ``path`` exists on the initramfs,
             :data:`False` otherwise
         """
-        for item in self:
-            if path in item:
-                return True
-        return False
+        return path in self._paths
 
     def __eq__(self, other: object) -> bool:
         return isinstance(other, type(self)) and self.user == other.user \
@@ -214,35 +307,57 @@ class Initramfs:
             (missing parent directory or file conflict)
         """
 
-        #: Used to check all parents directories exist and are created
-        #: before the creation/merge of new_item
-        parents = {os.path.dirname(k): False for k in new_item if k != '/'}
-        mergeable = None
-        for cur_item in self:
-            # Check if new_item can be merged or is conflicting with cur_item
-            if cur_item.is_mergeable(new_item):
-                assert mergeable is None
-                mergeable = cur_item
-            for dest in new_item:
-                if cur_item is not mergeable and dest in cur_item:
-                    raise MergeError(
-                        f"File collision between {new_item} and {cur_item}"
-                    )
-                if mergeable is None and os.path.dirname(dest) in cur_item:
-                    parents[os.path.dirname(dest)] = True
-
-        if not all(parents.values()):
-            missings = tuple(k for k in parents if not parents[k])
+        # Items which can be merged share a path or a merge key,
+        # each distinct item is only checked once
+        dests = tuple(new_item)
+        owners = [self._paths.get(dest) for dest in dests]
+        candidates = {id(item): item for item in owners if item is not None}
+        key = new_item.merge_key()
+        keyed = self._merge_keys.get(key) if key is not None else None
+        if keyed is not None:
+            candidates.setdefault(id(keyed), keyed)
+        mergeable = next((
+            item for item in candidates.values()
+            if item.is_mergeable(new_item)
+        ), None)
+
+        for cur_item in owners:
+            if cur_item is not None and cur_item is not mergeable:
+                raise MergeError(
+                    f"File collision between {new_item} and {cur_item}"
+                )
+
+        # Paths are normalized and absolute: rpartition is a cheap dirname
+        parents = {dest.rpartition('/')[0] or '/'
+                   for dest in dests if dest != '/'}
+        missings = tuple(sorted(
+            parent for parent in parents if parent not in self._paths
+        ))
+        if missings:
             logger.error("Cannot add %s: missing directories %s",
                          new_item, missings)
             raise MergeError(f"Missing directory: {missings}")
         if mergeable is not None:
             mergeable.merge(new_item)
+            for dest in dests:
+                self._paths[dest] = mergeable
         else:
-            # Add new_item
-            self.items.append(new_item)
+            self.__append(new_item, key)
             logger.debug("New item: %s", new_item)
 
+    def __append(self, item: Item, key: Optional[Hashable]) -> None:
+        """Append an item to the initramfs and index it
+
+        :param item: :class:`Item` to append
+        :param key: Merge key of ``item``, as returned by
+            :meth:`Item.merge_key`
+        """
+        self.items.append(item)
+        for dest in item:
+            self._paths[dest] = item
+        if key is not None:
+            self._merge_keys.setdefault(key, item)
+
     @staticmethod
     def __normalize(path: str) -> str:
         """Normalize a path for the initramfs filesystem
@@ -260,14 +375,12 @@ class Initramfs:
         if not os.path.isabs(path):
             raise ValueError(f"{path} is not an absolute path")
         # Strip /usr directory, not needed in initramfs
-        if path.startswith('/usr/local/'):
-            logger.debug("Stripping /usr/local/ from %s", path)
-            path = removeprefix(path, '/usr/local')
-        elif path.startswith('/usr/'):
-            logger.debug("Stripping /usr/ from %s", path)
-            path = removeprefix(path, '/usr')
+        if path.startswith(_USR_PREFIXES):
+            prefix = next(p for p in _USR_PREFIXES if path.startswith(p))
+            logger.debug("Stripping %s from %s", prefix, path)
+            path = path[len(prefix) - 1:]
         # Check whitespaces
-        if len(path.split()) != 1:
+        if _WHITESPACE.search(path) is not None:
             logger.warning("Whitespaces are not supported by gen_init_cpio: "
                            "%s", path)
         return path
@@ -284,10 +397,15 @@ class Initramfs:
         :raises MergeError: Destination file exists and is different,
             or missing parent directory (raised from :meth:`add_item`)
         """
-        logger.debug("Creating directory %s", path)
-        if parents and os.path.dirname(path) not in self:
-            self.mkdir(os.path.dirname(path), mode=mode, parents=True)
-        self.add_item(Directory(mode, self.user, self.group, path))
+        # Missing ancestors, deepest first
+        missings = []
+        parent = path.rpartition('/')[0] or '/'
+        while parents and parent not in self and parent != '/':
+            missings.append(parent)
+            parent = parent.rpartition('/')[0] or '/'
+        for directory in (*reversed(missings), path):
+            logger.debug("Creating directory %s", directory)
+            self.add_item(Directory(mode, self.user, self.group, directory))
 
     def add_file(self, src: str, dest: Optional[str] = None,
                  mode: Optional[int] = None) -> None:
@@ -306,27 +424,128 @@ class Initramfs:
             or missing parent directory (raised from :meth:`add_item`)
         """
 
-        # Sanity checks
-        if not os.path.exists(src):
-            raise FileNotFoundError(src)
-
         # Configure paths
         src = os.path.abspath(src)
         if not dest:
             dest = src
         dest = Initramfs.__normalize(dest)
 
+        # Shared libraries are requested once per dependent executable,
+        # repeated requests are only a set lookup
+        key = (src, dest, mode)
+        if key in self._added:
+            return
+
+        # Sanity checks, the stat result is reused for the mode and hash
+        src_stat = os.stat(src)
+
         logger.debug("Adding %s as %s", src, dest)
 
-        # Copy dependencies
-        for dep_src, dep_dest in find_elf_deps_set(src, self.binroot):
+        # Copy dependencies, sorted: aliases of a library are merged into
+        # the first one added, which must not depend on the hash seed
+        deps = sorted(find_elf_deps_set(src, self.binroot))
+        for dep_src, dep_dest in deps:
             self.add_file(dep_src, dep_dest)
 
         # Add file
         if mode is None:
-            mode = os.stat(src, follow_symlinks=True).st_mode & 0o7777
+            mode = src_stat.st_mode & 0o7777
         self.add_item(File(mode, self.user, self.group,
-                           {dest}, src, hash_file(src)))
+                           {dest}, src, hash_file(src, stat=src_stat)))
+        self._added.add(key)
+
+    def __resolve(self, src: str) -> FrozenSet[str]:
+        """Hash a file and find its ELF dependencies (cached)
+
+        :param src: Absolute path of the file
+        :return: Sources of the ELF dependencies of ``src``
+        """
+        try:
+            hash_file(src)
+            return frozenset(
+                dep for dep, _ in find_elf_deps_set(src, self.binroot)
+            )
+        except (ELFError, OSError) as err:
+            # Raised again by add_file()
+            logger.debug("Cannot prefetch %s: %s", src, err)
+            return frozenset()
+
+    def prefetch(self, srcs: Iterable[str], jobs: Optional[int] = None) \
+            -> None:
+        """Read files and their ELF dependencies in parallel
+
+        :meth:`add_file` hashes files and parses their ELF dependencies,
+        which is mostly I/O. This method fills the caches of
+        :func:`hash_file` and :func:`find_elf_deps_set` concurrently,
+        so the following :meth:`add_file` calls only merge the items.
+        Those caches have no size limit: the results are kept until
+        another :class:`Initramfs` is created (see :func:`clear_caches`).
+        Errors are not raised, :meth:`add_file` will raise them.
+
+        :param srcs: Source files which will be added
+        :param jobs: Number of threads, see
+            :class:`concurrent.futures.ThreadPoolExecutor`
+        """
+        Initramfs.__closure(
+            self.__resolve, (os.path.abspath(src) for src in srcs), jobs
+        )
+
+    def __resolve_kmod(self, kmod_kernel: Tuple[str, str]) \
+            -> FrozenSet[Tuple[str, str]]:
+        """Find, hash and get the dependencies of a kernel module (cached)
+
+        :param kmod_kernel: Name of the kernel module and target kernel
+        :return: Dependencies of the module, with the target kernel
+        """
+        module, kernel = kmod_kernel
+        try:
+            kmod = find_kmod(module, kernel)
+            if kmod is None:
+                return frozenset()
+            self.__resolve(kmod)
+            return frozenset((dep, kernel) for dep in find_kmod_deps(kmod))
+        except (OSError, subprocess.CalledProcessError) as err:
+            # Raised again by add_kmod()
+            logger.debug("Cannot prefetch module %s: %s", module, err)
+            return frozenset()
+
+    def prefetch_kmods(self, modules: Iterable[str],
+                       jobs: Optional[int] = None) -> None:
+        """Find and read kernel modules and their dependencies in parallel
+
+        Same as :meth:`prefetch` for :meth:`add_kmod`: fills the caches
+        of :func:`find_kmod`, :func:`find_kmod_deps` (which runs
+        ``modinfo``) and :func:`hash_file` for all target kernels.
+
+        :param modules: Kernel modules which will be added
+        :param jobs: Number of threads, see
+            :class:`concurrent.futures.ThreadPoolExecutor`
+        """
+        roots = ((module, kernel)
+                 for module in modules for kernel in self.kernels)
+        Initramfs.__closure(self.__resolve_kmod, roots, jobs)
+
+    @staticmethod
+    def __closure(resolve: Callable[[_T], Iterable[_T]],
+                  roots: Iterable[_T], jobs: Optional[int]) -> None:
+        """Call ``resolve`` on ``roots`` and the values it returns, once each
+
+        :param resolve: Function returning the dependencies of its argument
+        :param roots: Initial arguments of ``resolve``
+        :param jobs: Number of threads, see
+            :class:`concurrent.futures.ThreadPoolExecutor`
+        """
+        seen: Set[_T] = set()
+        todo = list(roots)
+        pending: Set[Future[Iterable[_T]]] = set()
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            while todo or pending:
+                for arg in todo:
+                    if arg not in seen:
+                        seen.add(arg)
+                        pending.add(pool.submit(resolve, arg))
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                todo = [dep for future in done for dep in future.result()]
 
     def add_library(self, src: str, dest: Optional[str] = None,
                     mode: Optional[int] = None) -> None:
@@ -367,6 +586,9 @@ class Initramfs:
     def add_kmod(self, module: str, mode: Optional[int] = None) -> None:
         """Add a kernel module to the initramfs
 
+        Modules are looked up serially, call :meth:`prefetch_kmods`
+        with all the modules first to look them up in parallel.
+
         :param module: Path or name of the kernel module to add
         :param mode: File permissions to use, defaults to same as ``module``
         """
@@ -375,17 +597,25 @@ class Initramfs:
             logger.error("%s: cannot add kernel module: no kernel selected",
                          module)
 
-        def _add_kmod(module: str, kernel: str) -> None:
+        def _find_kmods(module: str, kernel: str,
+                        kmods: Dict[str, None]) -> None:
             kmod = find_kmod(module, kernel)
-            if kmod is None:
+            if kmod is None or kmod in kmods:
                 return
-            for dep in find_kmod_deps(kmod):
-                _add_kmod(dep, kernel)
-            self.mkdir(os.path.dirname(kmod), parents=True)
-            self.add_file(kmod, mode=mode)
+            for dep in sorted(find_kmod_deps(kmod)):
+                _find_kmods(dep, kernel, kmods)
+            kmods[kmod] = None
 
         for kernel in self.kernels:
-            _add_kmod(module, kernel)
+            # Dependencies first, each module once
+            kmods: Dict[str, None] = {}
+            _find_kmods(module, kernel, kmods)
+            # Modules share few directories, create each of them once
+            for directory in sorted({os.path.dirname(kmod)
+                                     for kmod in kmods}):
+                self.mkdir(directory, parents=True)
+            for kmod in kmods:
+                self.add_file(kmod, mode=mode)
 
     def add_busybox(self, needed: Iterable[str] = (),
                     sys_busybox: Optional[str] = None) -> None:
@@ -414,12 +644,26 @@ class Initramfs:
 
         busybox_src, busybox_dest = find_exec('busybox', root=self.binroot)
         self.add_file(busybox_src, busybox_dest)
-        for applet in busybox_get_applets(sys_busybox):
-            applets.add(os.path.basename(applet))
-            try:
-                self.add_file(busybox_src, applet)
-            except MergeError:
+        # Add all applets at once, as hardlinks of busybox
+        applet_dests = set()
+        for applet in _busybox_applets(sys_busybox):
+            dest = Initramfs.__normalize(applet)
+            parent, _, name = dest.rpartition('/')
+            applets.add(name)
+            if dest in self:
                 logger.debug("Not adding applet %s: file exists", applet)
+            elif (parent or '/') not in self:
+                logger.debug("Not adding applet %s: missing directory",
+                             applet)
+            else:
+                applet_dests.add(dest)
+        if applet_dests:
+            src = os.path.abspath(busybox_src)
+            src_stat = os.stat(src)
+            self.add_item(File(
+                src_stat.st_mode & 0o7777, self.user, self.group, applet_dests,
+                src, hash_file(src, stat=src_stat),
+            ))
         for dep in needed:
             if dep not in applets:
                 logger.debug("Adding missing applet: %s", dep)
@@ -433,23 +677,44 @@ class Initramfs:
 
         :param dest: Stream in which the list is written
         """
+        lines = []
         for item in self:
             logger.debug("Outputting %s", item)
-            dest.write(item.build_to_cpio_list())
-            dest.write('\n')
+            lines.append(item.build_to_cpio_list())
+        lines.append('')
+        dest.write('\n'.join(lines))
 
-    def build_to_directory(self, dest: str, do_nodes: bool = True) -> None:
+    def build_to_directory(self, dest: str, do_nodes: bool = True,
+                           jobs: Optional[int] = None) -> None:
         """Copy or create all items to a real filesystem
 
         See :meth:`Item.build_to_directory`.
+        Directories, symlinks and nodes are created first, in order,
+        then files are copied in parallel.
 
         :param dest: Path to use as root directory of the initramfs
         :param do_nodes: Also creates :class:`Node` items, (used for debugging:
             ``CAP_MKNOD`` is needed to create some special devices)
+        :param jobs: Number of threads copying files, see
+            :class:`concurrent.futures.ThreadPoolExecutor`
         """
+        files: List[File] = []
         for item in self:
             if not do_nodes and isinstance(item, Node):
                 logger.warning("Not building Node %s", item)
                 continue
+            if isinstance(item, File):
+                files.append(item)
+                continue
+            logger.debug("Building %s", item)
+            item.build_to_directory(dest)
+
+        def build(item: File) -> None:
             logger.debug("Building %s", item)
             item.build_to_directory(dest)
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(build, item) for item in files]
+            # All copies are attempted, the first error is raised
+            for future in futures:
+                future.result()
@@ -6,6 +6,7 @@ provide methods used by :class:`Initramfs` generation methods.
 
 from __future__ import annotations
 
+import errno
 import logging
 import os
 import socket
@@ -13,12 +14,88 @@ import stat
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from enum import Enum
-from typing import Iterator, Set
+from typing import Hashable, Iterator, Optional, Set
 
 from .utils import hash_file
 
 
 logger = logging.getLogger(__name__)
+#: :func:`os.copy_file_range` is available, cleared if the kernel lacks it
+_HAS_COPY_FILE_RANGE = hasattr(os, 'copy_file_range')
+#: :func:`os.sendfile` is available, cleared if the kernel lacks it
+_HAS_SENDFILE = hasattr(os, 'sendfile')
+#: Errors of :func:`os.copy_file_range` meaning it cannot copy the file
+_COPY_FILE_RANGE_UNSUPPORTED = frozenset((
+    errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+))
+
+
+def _copy_file_range(src: int, dest: int) -> bool:
+    """Copy a file within the kernel, without user space buffers
+
+    :param src: File descriptor of the source file
+    :param dest: File descriptor of the destination file
+    :return: :data:`False` if the file cannot be copied this way,
+        nothing has been copied in this case
+    :raises OSError: Error during the copy
+    """
+    global _HAS_COPY_FILE_RANGE
+    if not _HAS_COPY_FILE_RANGE:
+        return False
+    copied = 0
+    while True:
+        try:
+            count = os.copy_file_range(src, dest, 1 << 30)
+        except OSError as err:
+            if copied == 0 and err.errno in _COPY_FILE_RANGE_UNSUPPORTED:
+                # Other errors depend on the files, try again next time
+                if err.errno == errno.ENOSYS:
+                    _HAS_COPY_FILE_RANGE = False
+                return False
+            raise
+        if count == 0:
+            # Nothing copied from a non-empty file (e.g. pseudo-files):
+            # the kernel cannot copy it this way
+            return copied > 0 or os.fstat(src).st_size == 0
+        copied += count
+
+
+#: Errors of :func:`os.sendfile` meaning it cannot copy the file
+_SENDFILE_UNSUPPORTED = frozenset((
+    errno.ENOSYS, errno.EINVAL, errno.ENOTSOCK, errno.EOPNOTSUPP,
+))
+
+
+def _sendfile(src: int, dest: int) -> bool:
+    """Copy a file with :func:`os.sendfile`, without user space buffers
+
+    Fallback of :func:`_copy_file_range` when the files are not on
+    the same file system or the kernel cannot copy between them.
+
+    :param src: File descriptor of the source file
+    :param dest: File descriptor of the destination file
+    :return: :data:`False` if the file cannot be copied this way,
+        nothing has been copied in this case
+    :raises OSError: Error during the copy
+    """
+    global _HAS_SENDFILE
+    if not _HAS_SENDFILE:
+        return False
+    copied = 0
+    while True:
+        try:
+            count = os.sendfile(dest, src, None, 1 << 30)
+        except OSError as err:
+            if copied == 0 and err.errno in _SENDFILE_UNSUPPORTED:
+                if err.errno == errno.ENOSYS:
+                    _HAS_SENDFILE = False
+                return False
+            raise
+        if count == 0:
+            # Nothing copied from a non-empty file (e.g. pseudo-files):
+            # the kernel cannot copy it this way
+            return copied > 0 or os.fstat(src).st_size == 0
+        copied += count
 
 
 class MergeError(Exception):
@@ -40,6 +117,19 @@ class Item(ABC):
         """
         return self == other
 
+    def merge_key(self) -> Optional[Hashable]:
+        """Key of the items which can be merged into this item
+
+        Items are only looked up by this key if they do not share a path
+        (e.g. :class:`File` with different destinations). Items with an
+        equal key are then checked with :meth:`is_mergeable`.
+        By default, items can only be merged if they share a path.
+
+        :return: Hashable key, or :data:`None` if the item can only be
+            merged with items at the same path
+        """
+        return None
+
     def merge(self, other: Item) -> None:
         """Merge two items together
 
@@ -147,7 +237,8 @@ class File(Item):
     :param dests: Paths in the initramfs (hard-linked)
     :param src: Source file to copy (not unique to the file)
     :param data_hash: Hash of the file (can be obtained with :func:`hash_file`)
-    :param chunk_size: Chunk size to use when copying the file
+    :param chunk_size: Chunk size to use when copying the file, if the
+        kernel cannot copy it
     """
     mode: int
     user: int
@@ -155,7 +246,7 @@ class File(Item):
     dests: Set[str]
     src: str
     data_hash: bytes
-    chunk_size: int = 65536
+    chunk_size: int = 1 << 20
 
     def __str__(self) -> str:
         return f"file from {self.src}"
@@ -167,6 +258,9 @@ class File(Item):
             and self.user == other.user \
             and self.group == other.group
 
+    def merge_key(self) -> Optional[Hashable]:
+        return (self.data_hash, self.mode, self.user, self.group)
+
     def merge(self, other: Item) -> None:
         if self.is_mergeable(other):
             assert isinstance(other, File)
@@ -181,11 +275,11 @@ class File(Item):
         return path in self.dests
 
     def build_to_cpio_list(self) -> str:
-        dests = iter(sorted(self.dests))
-        return f'file {next(dests)} {self.src} ' \
-            + f'{self.mode:03o} {self.user} {self.group}' \
-            + (' ' if len(self.dests) > 1 else '') \
-            + ' '.join(dests)
+        first, *links = sorted(self.dests)
+        return ' '.join((
+            f'file {first} {self.src} {self.mode:03o} {self.user} '
+            f'{self.group}', *links
+        ))
 
     def build_to_directory(self, base_dir: str) -> None:
         iter_dests = iter(self.dests)
@@ -193,8 +287,12 @@ class File(Item):
         base_dest = base_dir + next(iter_dests)
         with open(self.src, 'rb') as src_file, \
                 open(base_dest, 'wb') as dest_file:
-            for chunk in iter(lambda: src_file.read(self.chunk_size), b''):
-                dest_file.write(chunk)
+            src_fd, dest_fd = src_file.fileno(), dest_file.fileno()
+            if not _copy_file_range(src_fd, dest_fd) \
+                    and not _sendfile(src_fd, dest_fd):
+                for chunk in iter(lambda: src_file.read(self.chunk_size),
+                                  b''):
+                    dest_file.write(chunk)
         os.chmod(base_dest, self.mode)
         os.chown(base_dest, self.user, self.group)
         # Hardlink other files
@@ -4,7 +4,15 @@ from __future__ import annotations
 
 import functools
 import hashlib
+import json
+import locale
+import logging
+import mmap
 import os.path
+import tempfile
+from typing import Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
 
 
 # Function needed for python < 3.9
@@ -30,16 +38,124 @@ def normpath(path: str) -> str:
     return os.path.normpath(path).replace('//', '/')
 
 
-@functools.lru_cache()
-def hash_file(filepath: str, chunk_size: int = 65536) -> bytes:
-    """Calculate the SHA512 of a file
+#: Cache of :func:`hash_file`: ``{(st_dev, st_ino, st_size, st_mtime_ns,
+#: st_ctime_ns): hash}``, hard links and aliased paths share an entry
+_HASH_CACHE: Dict[Tuple[int, int, int, int, int], bytes] = {}
+#: Keys of :data:`_HASH_CACHE` looked up by this process, saved by
+#: :func:`save_hash_cache`
+_HASH_CACHE_USED: Set[Tuple[int, int, int, int, int]] = set()
+
+
+def _hash_file(filepath: str, size: int, chunk_size: int) -> bytes:
+    """Calculate the SHA256 of a file (not cached)
 
     :param filepath: Path of the file to hash
+    :param size: Size of the file
     :param chunk_size: Number of bytes per chunk of file to hash
     :return: File hash in a :class:`bytes` object
     """
-    sha512 = hashlib.sha512()
+    sha256 = hashlib.sha256()
     with open(filepath, 'rb') as src:
+        # Hash the whole mapping at once, hashlib releases the GIL
+        if size > 0:
+            try:
+                with mmap.mmap(src.fileno(), 0, prot=mmap.PROT_READ) as mem:
+                    sha256.update(mem)
+                return sha256.digest()
+            except (OSError, ValueError):
+                pass
         for chunk in iter(lambda: src.read(chunk_size), b''):
-            sha512.update(chunk)
-    return sha512.digest()
+            sha256.update(chunk)
+    return sha256.digest()
+
+
+def hash_file(filepath: str, chunk_size: int = 1 << 20,
+              stat: Optional[os.stat_result] = None) -> bytes:
+    """Calculate the SHA256 of a file
+
+    The result is cached by device, inode, size, modification and change
+    time: a file is only read once, unless it is modified, even if it is
+    reached through several paths. The cache can be kept between runs
+    with :func:`save_hash_cache` and :func:`load_hash_cache`.
+
+    :param filepath: Path of the file to hash
+    :param chunk_size: Number of bytes per chunk of file to hash
+    :param stat: Result of :func:`os.stat` on ``filepath``, if the
+        caller already has it
+    :return: File hash in a :class:`bytes` object
+    """
+    if stat is None:
+        stat = os.stat(filepath)
+    key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns,
+           stat.st_ctime_ns)
+    digest = _HASH_CACHE.get(key)
+    if digest is None:
+        digest = _hash_file(filepath, stat.st_size, chunk_size)
+        _HASH_CACHE[key] = digest
+    # Recorded once the digest is stored: hashing may fail above
+    _HASH_CACHE_USED.add(key)
+    return digest
+
+
+def load_hash_cache(path: str) -> None:
+    """Load :func:`hash_file` results saved by :func:`save_hash_cache`
+
+    The change time is part of the cache key and cannot be set by
+    user space, files replaced since the cache was saved are hashed again.
+    A missing cache file is ignored, an invalid one is logged and ignored.
+
+    :param path: Path of the cache file
+    """
+    try:
+        with open(path, 'r') as cache_file:
+            entries = json.load(cache_file)
+        cache = {}
+        for key, digest in entries.items():
+            dev, ino, size, mtime_ns, ctime_ns = map(int, key.split(':'))
+            cache[dev, ino, size, mtime_ns, ctime_ns] = bytes.fromhex(digest)
+    except FileNotFoundError:
+        return
+    except (OSError, AttributeError, TypeError, ValueError) as err:
+        logger.warning("Ignoring invalid hash cache %s: %s", path, err)
+        return
+    logger.debug("Loaded %d hashes from %s", len(cache), path)
+    _HASH_CACHE.update(cache)
+
+
+def save_hash_cache(path: str) -> None:
+    """Save :func:`hash_file` results to a file
+
+    Only the files hashed or looked up by this process are saved, entries
+    of files which are no longer used are dropped.
+    The file is replaced atomically. See :func:`load_hash_cache`.
+
+    :param path: Path of the cache file
+    :raises OSError: Cannot write the cache file
+    """
+    entries = {
+        ':'.join(map(str, key)): _HASH_CACHE[key].hex()
+        for key in _HASH_CACHE_USED
+    }
+    # Unique temporary file, concurrent builds may share the cache
+    cache_file = tempfile.NamedTemporaryFile(
+        'w', dir=os.path.dirname(path) or os.curdir,
+        prefix=f'.{os.path.basename(path)}.', delete=False,
+    )
+    try:
+        with cache_file:
+            json.dump(entries, cache_file)
+        os.replace(cache_file.name, path)
+    except BaseException:
+        os.remove(cache_file.name)
+        raise
+
+
+@functools.lru_cache(maxsize=1)
+def is_utf8_locale() -> bool:
+    """Check if the default locale uses the UTF-8 encoding
+
+    The result is cached, the locale is only parsed once.
+
+    :return: :data:`True` if the default locale encoding is UTF-8
+    """
+    return locale.getdefaultlocale()[1] == 'UTF-8'
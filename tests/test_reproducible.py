@@ -0,0 +1,47 @@
+"""Check that the generated initramfs does not depend on the hash seed"""
+
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+
+#: Build a CPIO list of executables with shared library dependencies
+_SCRIPT = '''
+import sys
+from cmkinitramfs.initramfs import Initramfs
+initramfs = Initramfs(kernels=())
+for executable in sys.argv[1:]:
+    try:
+        initramfs.add_file(executable)
+    except FileNotFoundError:
+        pass
+initramfs.build_to_cpio_list(sys.stdout)
+'''
+#: Executables linked to several libraries, only those found are used
+_EXECUTABLES = ('sh', 'bash', 'ls', 'ssh', 'curl')
+
+
+class TestReproducible(unittest.TestCase):
+    """Initramfs output with different ``PYTHONHASHSEED`` values"""
+
+    def test_cpio_list(self) -> None:
+        executables = [os.path.realpath(path) for path in map(
+            shutil.which, _EXECUTABLES
+        ) if path is not None]
+        if not executables:
+            self.skipTest("no executable found")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        outputs = set()
+        for seed in ('0', '1', '2', '3'):
+            env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=root)
+            outputs.add(subprocess.run(
+                (sys.executable, '-c', _SCRIPT, *executables),
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                env=env, check=True, text=True,
+            ).stdout)
+        self.assertEqual(len(outputs), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()